@@ -0,0 +1,71 @@
+"""
+Measures the daily chart with hundreds of cities: the one-time preparation of the per day data of all countries,
+then for zoom levels from all years down to one month the server side latency of a range update
+(decimation + source update + message serialization) and the size of the message sent to the browser,
+compared with sending all points of the visible range.
+
+Run from the repository root:
+    python -m benchmarks.bench_daily [--scale 10] [--years 10] [--repeats 20]
+"""
+import argparse
+import statistics
+import time
+
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource, Range1d
+
+import daily_data
+import dst_scenarios
+import index
+from benchmarks.bench_map_toggle import message_size
+from benchmarks.bench_pipeline import scaled_city_data
+
+ZOOM_DAYS = [3650, 365, 90, 30]
+COUNTRY = 'DE'
+
+
+def measure_zoom(daily: dict, days: int, max_points: int, repeats: int) -> tuple[int, float]:
+    x = daily['x']
+    x_range = Range1d(start=x[0], end=x[min(days, len(x)) - 1])
+    source = ColumnDataSource()
+    doc = Document()
+    doc.add_root(index.bokeh_plot_daily(source, x_range))
+    events = []
+    doc.on_change(events.append)
+
+    sizes, latencies = [], []
+    for k in range(repeats):
+        # Pan by one day per repeat, like dragging the plot
+        x_start, x_end = x_range.start + k * 86_400_000, x_range.end + k * 86_400_000
+        events.clear()
+        start = time.perf_counter()
+        source.data = index.get_daily_source_data(daily, COUNTRY, x_start, x_end, max_points)
+        sizes.append(message_size(events))
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(sizes), statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='City set size relative to city_data.csv')
+    parser.add_argument('--years', type=int, default=daily_data.DAILY_YEARS)
+    parser.add_argument('--repeats', type=int, default=20, help='Range updates per zoom level')
+    args = parser.parse_args()
+
+    cities = scaled_city_data(args.scale)
+    dates = daily_data.get_daily_dates(args.years)
+    start = time.perf_counter()
+    daily = daily_data.get_daily_country_data(cities, dates, dst_scenarios.EU_RULE)
+    print(f"{len(cities)} cities x {len(dates)} days prepared in {time.perf_counter() - start:.2f} s")
+
+    decimated_points = index.daily_points_per_pixel * index.daily_plot_width
+    print(f"{'visible days':>12} | {'decimated KB':>12} | {'ms':>6} | {'all points KB':>13} | {'ms':>6}")
+    for days in ZOOM_DAYS:
+        size, latency = measure_zoom(daily, days, decimated_points, args.repeats)
+        full_size, full_latency = measure_zoom(daily, days, len(dates), args.repeats)
+        print(f"{days:>12} | {size / 1024:12.1f} | {latency * 1000:6.2f} | {full_size / 1024:13.1f} | "
+              f"{full_latency * 1000:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
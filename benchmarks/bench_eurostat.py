@@ -0,0 +1,123 @@
+"""
+Compares the row-wise Urban Audit parsing that _get_top_n_pop_cities_per_country used before with the
+columnar and the streaming eurostat loader, on the full TSV and on a synthetic file 100x larger.
+Then compares the peak memory of the columnar and the streaming loader on synthetic multi-indicator exports
+of growing size.
+
+Run from the repository root:
+    python -m benchmarks.bench_eurostat [--scale 100] [--repeat 3] [--indicators 20]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import eurostat
+
+COUNTRIES = pd.read_csv('datasets/saved/eu_country_codes.csv')['iso_A2']
+TOP_N_POP = 3
+
+
+def legacy_top_n(path: str, top_n_pop: int) -> pd.DataFrame:
+    eu_cities_pop_full = pd.read_csv(path, sep='\t', header=0)
+    eu_cities_pop_full = eu_cities_pop_full.replace(r'^(\D+)$', 0, regex=True)
+    eu_cities_pop = pd.DataFrame()
+    eu_cities_pop['code_info'] = eu_cities_pop_full.iloc[:, 0]
+    eu_cities_pop['population'] = eu_cities_pop_full.iloc[:, 1:].applymap(
+        lambda x: int(x.split(' ')[0]) if type(x) != int else x).astype('int32').max(axis=1)
+    eu_cities_pop['CODE'] = eu_cities_pop.iloc[:, 0].apply(lambda x: x.split(',')[-1])
+    eu_cities_pop = eu_cities_pop[eu_cities_pop['CODE'].apply(lambda x: x[-1] == 'C')]
+    eu_cities_pop['country_ISO_A2'] = eu_cities_pop['CODE'].apply(lambda x: x[0:2])
+    eu_cities_pop = eu_cities_pop[eu_cities_pop['country_ISO_A2'].isin(COUNTRIES)]
+    return eu_cities_pop.groupby('country_ISO_A2').apply(
+        lambda x: x.nlargest(top_n_pop, 'population')).reset_index(drop=True)
+
+
+def columnar_top_n(path: str, top_n_pop: int) -> pd.DataFrame:
+    urban_audit = eurostat.read_urban_audit_tsv(path)
+    urban_audit = urban_audit[urban_audit['indic_ur'] == eurostat.POPULATION_INDICATOR]
+    population = eurostat.max_population_per_city(urban_audit, COUNTRIES)
+    return eurostat.top_n_per_country(population, top_n_pop)
+
+
+def streaming_top_n(path: str, top_n_pop: int) -> pd.DataFrame:
+    return eurostat.stream_top_n_population(top_n_pop, COUNTRIES, path=path)
+
+
+def write_scaled_tsv(path: str, scale: int, out_path: str, indicators: int = 1):
+    """
+    Writes a copy of the TSV at path with every data row repeated scale times under new spatial unit codes
+    (country prefix and type suffix are kept, so filters behave the same), and indicators - 1 times more
+    under made up indicators.
+    """
+    with open(path) as f:
+        header, *rows = f.read().splitlines()
+    with open(out_path, 'w') as f:
+        f.write(header + '\n')
+        for k in range(scale):
+            for i in range(indicators):
+                for row in rows:
+                    key, values = row.split('\t', 1)
+                    freq, indicator, code = key.split(',')
+                    indicator = indicator if i == 0 else f'XX{i:04d}V'
+                    f.write(f'{freq},{indicator},{code[:2]}{k:03d}{code[2:]}\t{values}\n')
+
+
+def best_of(func, repeat: int, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory_mb(func, *args) -> float:
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=100, help='Size of the synthetic file relative to the full TSV')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--indicators', type=int, default=20,
+                        help='Number of indicators in the synthetic multi-indicator exports')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scaled_path = os.path.join(tmp, 'scaled.tsv')
+        write_scaled_tsv(eurostat.URBAN_AUDIT_TSV_PATH, args.scale, scaled_path)
+        for label, path in [('full TSV', eurostat.URBAN_AUDIT_TSV_PATH), (f'{args.scale}x synthetic', scaled_path)]:
+            expected = legacy_top_n(path, TOP_N_POP)['population'].tolist()
+            assert expected == columnar_top_n(path, TOP_N_POP)['population'].tolist()
+            assert expected == streaming_top_n(path, TOP_N_POP)['population'].tolist()
+            legacy = best_of(legacy_top_n, args.repeat, path, TOP_N_POP)
+            columnar = best_of(columnar_top_n, args.repeat, path, TOP_N_POP)
+            streaming = best_of(streaming_top_n, args.repeat, path, TOP_N_POP)
+            print(f'{label:>16}: legacy {legacy * 1000:9.1f} ms | columnar {columnar * 1000:9.1f} ms '
+                  f'| streaming {streaming * 1000:9.1f} ms | speedup {legacy / columnar:5.1f}x / '
+                  f'{legacy / streaming:5.1f}x')
+
+        print(f'\n{args.indicators} indicators | {"file MB":>8} | {"columnar s":>10} | {"peak MB":>8} | '
+              f'{"streaming s":>11} | {"peak MB":>8}')
+        for scale in sorted({1, max(1, args.scale // 10), args.scale}):
+            multi_path = os.path.join(tmp, f'multi_{scale}.tsv')
+            write_scaled_tsv(eurostat.URBAN_AUDIT_TSV_PATH, scale, multi_path, args.indicators)
+            assert columnar_top_n(multi_path, TOP_N_POP).equals(streaming_top_n(multi_path, TOP_N_POP))
+            print(f'{f"{scale}x cities":>13} | {os.path.getsize(multi_path) / 2 ** 20:8.1f} | '
+                  f'{best_of(columnar_top_n, 1, multi_path, TOP_N_POP):10.2f} | '
+                  f'{peak_memory_mb(columnar_top_n, multi_path, TOP_N_POP):8.1f} | '
+                  f'{best_of(streaming_top_n, 1, multi_path, TOP_N_POP):11.2f} | '
+                  f'{peak_memory_mb(streaming_top_n, multi_path, TOP_N_POP):8.1f}')
+            os.remove(multi_path)
+
+
+if __name__ == "__main__":
+    main()
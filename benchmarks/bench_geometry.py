@@ -0,0 +1,74 @@
+"""
+Compares the vectorized geometry functions with the row-wise implementations they replaced in geo_utils
+(a Mercator projection per row and a constant 80 km per degree of longitude) on random EU locations.
+
+Run from the repository root:
+    python -m benchmarks.bench_geometry [--points 1000000]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+import geometry
+
+EU_LAT_RANGE = (35.0, 70.0)
+EU_LON_RANGE = (-10.0, 35.0)
+LEGACY_LONGITUDE_DEGREE_KM_RATIO = 80
+
+
+def legacy_mercator(lat, lon):
+    # Former geo_utils._mercantor_from_coords, raises ZeroDivisionError for lon == 0
+    r_major = 6378137.000
+    x = r_major * math.radians(lon)
+    scale = x / lon
+    y = 180 / math.pi * math.log(math.tan(math.pi / 4 + lat * (math.pi / 180) / 2)) * scale
+    return x, y
+
+
+def legacy_longdiff_km(long, utc_offset):
+    # Former geo_utils._get_longdiff_km_for_utc_offset
+    return LEGACY_LONGITUDE_DEGREE_KM_RATIO * (15 * utc_offset - long)
+
+
+def timed(func, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=1_000_000, help='Number of random locations')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cities = pd.DataFrame({'longitude': rng.uniform(*EU_LON_RANGE, args.points),
+                           'latitude': rng.uniform(*EU_LAT_RANGE, args.points),
+                           'utc_offset': rng.integers(0, 3, args.points)})
+    lon, lat, offset = (cities[c].to_numpy() for c in ('longitude', 'latitude', 'utc_offset'))
+
+    cases = {
+        'mercator   row-wise': lambda: [legacy_mercator(la, lo) for la, lo in zip(lat, lon)],
+        'mercator   vectorized': lambda: geometry.web_mercator(lon, lat),
+        'meridian   row-wise apply': lambda: cities.apply(
+            lambda x: legacy_longdiff_km(x['longitude'], x['utc_offset']), axis=1),
+        'meridian   vectorized': lambda: geometry.meridian_distance_km(lon, lat, offset),
+    }
+    print(f"{args.points:,} points")
+    results = {}
+    for name, func in cases.items():
+        seconds, results[name] = timed(func)
+        print(f"{name:<28} {seconds:8.3f} s  {args.points / seconds:14,.0f} points/s")
+
+    x, y = results['mercator   vectorized']
+    legacy_x, legacy_y = np.array(results['mercator   row-wise']).T
+    print(f"mercator max. deviation     {max(np.abs(x - legacy_x).max(), np.abs(y - legacy_y).max()):.2e} m")
+    ratio = results['meridian   vectorized'] / results['meridian   row-wise apply'].to_numpy()
+    print(f"meridian km vs. 80 km/deg   {ratio.min():.2f} - {ratio.max():.2f} (cos-lat scaling)")
+
+
+if __name__ == "__main__":
+    main()
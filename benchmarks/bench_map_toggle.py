@@ -0,0 +1,83 @@
+"""
+Measures the size of the document patch sent to the browser and the server side latency
+(update + message serialization) for each DST/period toggle of the map, for three strategies:
+
+    new figure       build a new figure with new sources per toggle (how update_map used to work)
+    swap data        assign the precomputed variant to the .data of the existing sources
+    changed columns  index.update_changed_columns, only the columns that differ are sent
+
+Run from the repository root:
+    python -m benchmarks.bench_map_toggle [--cycles 20]
+"""
+import argparse
+import statistics
+import time
+
+from bokeh.document import Document
+from bokeh.layouts import column
+from bokeh.models import ColumnDataSource
+from bokeh.protocol import Protocol
+
+import index
+
+TOGGLE_SEQUENCE = [(True, False), (True, True), (False, True), (False, False)]
+
+
+def message_size(events) -> int:
+    protocol = Protocol()
+    size = 0
+    for event in events:
+        msg = protocol.create('PATCH-DOC', [event])
+        size += len(msg.header_json) + len(msg.metadata_json) + len(msg.content_json)
+        size += sum(buffer.data.nbytes for buffer in msg.buffers)
+    return size
+
+
+def run_strategy(strategy: str, cycles: int) -> tuple[list[int], list[float]]:
+    map_variants = index.get_toggle_variants()
+    variant = map_variants[(False, False)]
+    bar_source = ColumnDataSource(dict(variant['bars']))
+    divider_source = ColumnDataSource(dict(variant['dividers']))
+    patch_source = index.get_bokeh_patch_source()
+    layout = column(index.bokeh_plot_map(patch_source, bar_source, divider_source))
+    doc = Document()
+    doc.add_root(layout)
+
+    events = []
+    doc.on_change(events.append)
+    sizes, latencies = [], []
+    for _ in range(cycles):
+        for key in TOGGLE_SEQUENCE:
+            variant = map_variants[key]
+            events.clear()
+            start = time.perf_counter()
+            if strategy == 'new figure':
+                layout.children = [index.bokeh_plot_map(index.get_bokeh_patch_source(),
+                                                        ColumnDataSource(dict(variant['bars'])),
+                                                        ColumnDataSource(dict(variant['dividers'])))]
+            elif strategy == 'swap data':
+                bar_source.data = dict(variant['bars'])
+                divider_source.data = dict(variant['dividers'])
+            else:
+                index.update_changed_columns(bar_source, variant['bars'])
+                index.update_changed_columns(divider_source, variant['dividers'])
+            sizes.append(message_size(events))
+            latencies.append(time.perf_counter() - start)
+    return sizes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cycles', type=int, default=20, help='Number of times all four variants are cycled')
+    args = parser.parse_args()
+
+    print(f"{'strategy':>16} | {'bytes/toggle':>12} | {'median ms':>9} | {'p95 ms':>7}")
+    for strategy in ['new figure', 'swap data', 'changed columns']:
+        sizes, latencies = run_strategy(strategy, args.cycles)
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        print(f"{strategy:>16} | {statistics.mean(sizes):12.0f} | {statistics.median(latencies_ms):9.2f} | "
+              f"{latencies_ms[int(0.95 * (len(latencies_ms) - 1))]:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark suite for the geo_utils -> sun_data -> index.py pipeline. Runs fully offline: city sets are
+built from datasets/saved/city_data.csv, scaled up with synthetic cities jittered around the real ones,
+and geocoding is served from these fixtures instead of Nominatim.
+
+Every case is run once untimed to warm up, then timed (best and median of --repeats runs) and its peak memory
+is measured with tracemalloc in one extra run. Cold start cases (see benchmarks.bench_startup) are measured in
+fresh interpreters. Results are written to JSON together with the commit they were measured on, so two runs
+can be compared:
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline [--scales 1 10 100] [--repeats 5] [--only sunrise] [--out results.json]
+    python -m benchmarks.bench_pipeline --compare old.json new.json [--threshold 0.1]
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_startup import STARTUP_CASES, measure_startup
+
+RESULTS_DIR = 'benchmarks/results'
+CITY_DATA_PATH = 'datasets/saved/city_data.csv'
+EU_GPD_PATH = 'datasets/saved/eu_gpd.geojson'
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_THRESHOLD = 0.10  # Relative slowdown or memory growth flagged as a regression
+# Absolute changes below these are measurement noise and never flagged
+MIN_FLAGGED_SECONDS = 0.002
+MIN_FLAGGED_MB = 1.0
+SYNTHETIC_JITTER_DEG = 0.3
+
+
+class FixtureGeocoder:
+    """
+    Geocoding backend answering from a city dataframe with known coordinates, stands in for Nominatim.
+    """
+    name = 'fixture'
+    batch_size = None
+
+    def __init__(self, cities: pd.DataFrame):
+        import geocoding
+        queries = [geocoding.normalize_query(n, c) for n, c in zip(cities['NAME'], cities['country_ISO_A2'])]
+        self._coords = dict(zip(queries, zip(cities['latitude'], cities['longitude'])))
+
+    def geocode_many(self, queries: list[str]) -> dict[str, tuple]:
+        return {q: self._coords[q] for q in queries if q in self._coords}
+
+
+def scaled_city_data(scale: int, seed: int = 0) -> pd.DataFrame:
+    """
+    :param scale: Size of the returned city set relative to city_data.csv, 1 returns the real cities.
+    :param seed: Seed of the synthetic jitter, fixed so every run benchmarks the same cities.
+    :return: Returns city_data.csv with scale - 1 synthetic copies of every city, renamed and moved randomly
+    by up to SYNTHETIC_JITTER_DEG degrees.
+    """
+    cities = pd.read_csv(CITY_DATA_PATH)
+    rng = np.random.default_rng(seed)
+    copies = [cities]
+    for k in range(1, scale):
+        copy = cities.copy()
+        copy['NAME'] = copy['NAME'] + f' {k}'
+        copy['CODE'] = copy['CODE'].str[:2] + f'{k:04d}' + copy['CODE'].str[2:]
+        copy['latitude'] += rng.uniform(-SYNTHETIC_JITTER_DEG, SYNTHETIC_JITTER_DEG, len(copy))
+        copy['longitude'] += rng.uniform(-SYNTHETIC_JITTER_DEG, SYNTHETIC_JITTER_DEG, len(copy))
+        copy['population'] = (copy['population'] * rng.uniform(0.05, 1.0, len(copy))).astype('int64')
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+
+def get_cases(scales: list[int]) -> dict:
+    """
+    :param scales: City set sizes relative to city_data.csv.
+    :return: Returns a dict mapping case names to (setup, run) callables, run(setup()) is what gets measured.
+    """
+    import geopandas as gpd
+
+    import geo_utils
+    import geocoding
+    import sun_data
+
+    cases = {}
+    for top_n in (3, 50):
+        cases[f'geo_utils.top_n_pop_cities/top_n={top_n}'] = (
+            lambda top_n=top_n: top_n, geo_utils._get_top_n_pop_cities_per_country)
+
+    eu_data = gpd.read_file(EU_GPD_PATH)
+    for scale in scales:
+        cities = scaled_city_data(scale)
+        raw_cities = cities[['population', 'CODE', 'country_ISO_A2', 'NAME']]
+        geocoder = FixtureGeocoder(cities)
+        # A fresh in-memory cache per run, so every run resolves all cities through the backend
+        cases[f'geo_utils.timezone_features/cities={len(cities)}'] = (
+            lambda raw_cities=raw_cities, geocoder=geocoder: (raw_cities.copy(), [geocoder],
+                                                             geocoding.GeocodeCache(':memory:')),
+            lambda args: geo_utils._add_timezone_features_to_cities(*args))
+        cases[f'geo_utils.avg_country_data/cities={len(cities)}'] = (
+            lambda cities=cities: (cities.copy(), eu_data.copy()),
+            lambda args: geo_utils.get_avg_country_data(*args))
+        cases[f'sun_data.sunrise_avgs/cities={len(cities)}'] = (
+            lambda cities=cities: cities.copy(), sun_data.get_sunrise_data_avgs_for_countries)
+
+    cases['index.bokeh_plot_map'] = (_plot_map_setup, lambda args: args[0].bokeh_plot_map(*args[1:]))
+    cases['index.update_map/4_toggles'] = (_update_map_setup, _toggle_all)
+    return cases
+
+
+def _plot_map_setup():
+    from bokeh.models import ColumnDataSource
+    import index
+    variant = index.get_toggle_variants()[(False, False)]
+    return (index, index.get_bokeh_patch_source(),
+            ColumnDataSource(dict(variant['bars'])), ColumnDataSource(dict(variant['dividers'])))
+
+
+def _update_map_setup():
+    import panel as pn
+    import index
+    return index.create_app().select(pn.widgets.Switch)
+
+
+def _toggle_all(switches):
+    # Cycles through all four DST/period combinations, every switch flip triggers update_map once
+    for switch in switches + switches:
+        switch.value = not switch.value
+
+
+def measure(setup, run, repeats: int) -> dict:
+    # One untimed run first, so one-time costs (lazy imports, the timezone resolver, ...) are not charged
+    # to whichever case or scale happens to run first
+    run(setup())
+    timings = []
+    for _ in range(repeats):
+        args = setup()
+        start = time.perf_counter()
+        run(args)
+        timings.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    run(args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds_min': min(timings), 'seconds_median': statistics.median(timings),
+            'peak_mb': peak / 2 ** 20, 'repeats': repeats}
+
+
+def run_suite(args: argparse.Namespace) -> dict:
+    selected = (lambda name: any(fnmatch.fnmatch(name, f'*{pattern}*') for pattern in args.only)) if args.only \
+        else (lambda name: True)
+    # Startup cases first, they run in fresh interpreters and are unaffected by the imports of the other cases
+    cases = {name: lambda statement=statement: measure_startup(statement, args.repeats)
+             for name, statement in STARTUP_CASES.items()}
+    cases.update({name: lambda setup=setup, run=run: measure(setup, run, args.repeats)
+                  for name, (setup, run) in get_cases(args.scales).items()})
+    results = {}
+    for name, measure_case in cases.items():
+        if not selected(name):
+            continue
+        results[name] = measure_case()
+        r = results[name]
+        print(f"{name:<48} {r['seconds_median'] * 1000:10.1f} ms  {r['peak_mb']:8.1f} MB")
+    return {'meta': _meta(), 'results': results}
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """
+    Prints the relative change of every case measured in both runs.
+    :param old: Results of the baseline run as written by run_suite.
+    :param new: Results of the run to check.
+    :param threshold: Relative increase of median time or peak memory above which a case is flagged,
+    as long as the absolute increase is above MIN_FLAGGED_SECONDS or MIN_FLAGGED_MB.
+    :return: Returns the names of all cases flagged as regressions.
+    """
+    print(f"baseline {old['meta']['commit'][:10]} vs {new['meta']['commit'][:10]}")
+    print(f"{'case':<48} {'time':>8} {'memory':>8}")
+    regressions = []
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            print(f"{name:<48} {'new':>8}")
+            continue
+        base = old['results'][name]
+        time_change = result['seconds_median'] / base['seconds_median'] - 1
+        memory_change = result['peak_mb'] / base['peak_mb'] - 1 if base['peak_mb'] else 0.0
+        flag = ''
+        slower = time_change > threshold and result['seconds_median'] - base['seconds_median'] > MIN_FLAGGED_SECONDS
+        larger = memory_change > threshold and result['peak_mb'] - base['peak_mb'] > MIN_FLAGGED_MB
+        if slower or larger:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<48} {time_change:+8.1%} {memory_change:+8.1%}{flag}")
+    return regressions
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = 'unknown', False
+    return {'commit': commit.strip(), 'dirty': dirty, 'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='City set sizes relative to city_data.csv')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--only', nargs='+', help='Only run cases whose name contains one of these patterns')
+    parser.add_argument('--out', help=f'Output JSON file, defaults to {RESULTS_DIR}/<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'NEW'), help='Compare two result files')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative slowdown or memory growth flagged as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            regressions = compare(json.load(f_old), json.load(f_new), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    suite = run_suite(args)
+    out = args.out or os.path.join(RESULTS_DIR, f"{suite['meta']['commit'][:10] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(suite, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Load test of the served app: simulates many browser sessions the way panel serve creates them, i.e. index.py
+is executed in a new module, create_app() is called and its Bokeh models are built into a new document, and then
+every DST/period combination is toggled once. Reports the server side CPU time per session
+
+    shared cache  results in pn.state.cache are reused by all sessions (the default)
+    per session   the cache is cleared before every session, so each session prepares all data itself
+
+Run from the repository root:
+    python -m benchmarks.bench_sessions [--sessions 50]
+"""
+import argparse
+import runpy
+import statistics
+import time
+import warnings
+
+import panel as pn
+from bokeh.document import Document
+from bokeh.util.warnings import BokehDeprecationWarning
+
+INDEX_PATH = 'index.py'
+
+
+def run_session(session_nr: int, shared: bool) -> float:
+    start = time.process_time()
+    app_module = runpy.run_path(INDEX_PATH, run_name=f'bokeh_app_{session_nr}')
+    if not shared:
+        app_module['clear_result_cache']()
+    app = app_module['create_app']()
+    app.get_root(Document())
+    switches = app.select(pn.widgets.Switch)
+    for switch in switches + switches:
+        switch.value = not switch.value
+    return time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=50, help='Number of simulated sessions per mode')
+    args = parser.parse_args()
+    # Tile provider warnings are printed for every session
+    warnings.simplefilter('ignore', BokehDeprecationWarning)
+    warnings.filterwarnings('ignore', message='CartoDB tiles')
+
+    # Warm up imports and the map state on disk, neither is part of the per session cost
+    run_session(0, shared=True)
+    print(f"{'mode':>12} | {'sessions':>8} | {'mean ms':>8} | {'median ms':>9} | {'p95 ms':>7} | {'sessions/s':>10}")
+    for mode, shared in [('per session', False), ('shared cache', True)]:
+        cpu_ms = sorted(run_session(nr, shared) * 1000 for nr in range(1, args.sessions + 1))
+        print(f"{mode:>12} | {args.sessions:8} | {statistics.mean(cpu_ms):8.1f} | {statistics.median(cpu_ms):9.1f} | "
+              f"{cpu_ms[int(0.95 * (len(cpu_ms) - 1))]:7.1f} | {1000 * len(cpu_ms) / sum(cpu_ms):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
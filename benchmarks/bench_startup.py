@@ -0,0 +1,105 @@
+"""
+Measures cold start: the time and peak memory of importing the project modules and of building the
+Panel app, each in a fresh interpreter so nothing is cached by earlier imports. The same cases are part of
+benchmarks.bench_pipeline, so startup regressions show up in its --compare mode.
+
+Startup of the Pyodide build in docs/ cannot be timed without a browser, so for it the things that dominate it
+are reported instead: the packages the worker installs before running the app and the data files it loads.
+It fails if index.py imports a module of this repository (the worker would try to install it from PyPI and not
+start) and warns if docs/ was not converted from the current index.py.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--repeats 5] [--docs docs]
+"""
+import argparse
+import ast
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+STARTUP_CASES = {
+    'startup.import_geo_utils': 'import geo_utils',
+    'startup.import_sun_data': 'import sun_data',
+    'startup.import_index': 'import index',
+    'startup.create_app': 'import index; index.create_app()',
+}
+APP_SCRIPT = 'index.py'
+DOCS_DIR = 'docs'
+
+# Runs in the child interpreter, only the statement itself is measured
+_CHILD = """
+import json, time, tracemalloc
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'peak': tracemalloc.get_traced_memory()[1]}}))
+"""
+
+
+def measure_startup(statement: str, repeats: int) -> dict:
+    """
+    :param statement: Python code to run in a fresh interpreter, e.g. 'import index'.
+    :param repeats: Number of fresh interpreters to start for timing, peak memory is measured in one more.
+    :return: Returns the same result dict as bench_pipeline.measure.
+    """
+    timings = [_run_child(statement, trace=False)['seconds'] for _ in range(repeats)]
+    peak = _run_child(statement, trace=True)['peak']
+    return {'seconds_min': min(timings), 'seconds_median': statistics.median(timings),
+            'peak_mb': peak / 2 ** 20, 'repeats': repeats}
+
+
+def _run_child(statement: str, trace: bool) -> dict:
+    output = subprocess.run([sys.executable, '-c', _CHILD.format(statement=statement, trace=trace)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def pyodide_startup(docs_dir: str = DOCS_DIR) -> dict:
+    """
+    :param docs_dir: Output directory of panel convert, see the README.
+    :return: Returns a dict with 'packages' (installed by the worker, in order), 'data_kb' (size of every data file
+    next to the page) and 'up_to_date' (whether the worker runs the current index.py).
+    :raises RuntimeError: If index.py imports a module of this repository.
+    """
+    from panel.io.mime_render import find_imports
+
+    app_code = Path(APP_SCRIPT).read_text()
+    local_modules = [name for name in find_imports(app_code) if Path(f'{name}.py').exists() or Path(name).is_dir()]
+    if local_modules:
+        raise RuntimeError(f"{APP_SCRIPT} imports {local_modules}, panel convert would install them from PyPI")
+
+    worker = Path(docs_dir, 'index.js').read_text()
+    env_spec = ast.literal_eval(re.search(r'const env_spec = (\[.*?\])', worker).group(1))
+    # Wheels are given as URLs, everything else as requirement strings
+    packages = [spec.rsplit('/', 1)[-1].split('-')[0] if spec.endswith('.whl') else spec for spec in env_spec]
+    return {'packages': packages,
+            'data_kb': {path.name: path.stat().st_size / 1024 for path in sorted(Path(docs_dir).glob('*.npz'))},
+            # panel convert embeds the script as it is
+            'up_to_date': app_code.strip() in worker}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='Fresh interpreters per case')
+    parser.add_argument('--docs', default=DOCS_DIR, help='Output directory of panel convert')
+    args = parser.parse_args()
+
+    for name, statement in STARTUP_CASES.items():
+        r = measure_startup(statement, args.repeats)
+        print(f"{name:<28} {r['seconds_median'] * 1000:10.1f} ms  {r['peak_mb']:8.1f} MB")
+
+    pyodide = pyodide_startup(args.docs)
+    print(f"pyodide packages             {', '.join(pyodide['packages'])}")
+    for name, kb in pyodide['data_kb'].items():
+        print(f"pyodide data {name:<17} {kb:8.1f} KB")
+    if not pyodide['up_to_date']:
+        print(f"WARNING: {args.docs}/index.js was not converted from the current {APP_SCRIPT}, see the README")
+
+
+if __name__ == "__main__":
+    main()
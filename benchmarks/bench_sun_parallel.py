@@ -0,0 +1,64 @@
+"""
+Measures how solar_parallel.solar_events_parallel scales with the number of worker processes on a
+synthetic city set (random locations within the EU bounding box) over several years, and checks
+that every worker count returns exactly the single process result.
+
+Run from the repository root:
+    python -m benchmarks.bench_sun_parallel [--cities 900] [--years 10] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import solar_parallel
+import solar_position
+
+EU_LAT_RANGE = (35.0, 70.0)
+EU_LON_RANGE = (-10.0, 35.0)
+
+
+def random_cities(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return rng.uniform(*EU_LAT_RANGE, n), rng.uniform(*EU_LON_RANGE, n)
+
+
+def timed(func, *args, repeats: int, **kwargs) -> tuple[float, dict]:
+    best, result = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=900, help='Number of synthetic cities')
+    parser.add_argument('--years', type=int, default=10, help='Number of years of daily events')
+    parser.add_argument('--workers', type=int, nargs='+', help='Worker counts to test, defaults to powers of 2')
+    parser.add_argument('--repeats', type=int, default=3, help='Best of this many runs is reported')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or [2 ** i for i in range(int(np.log2(cpus)) + 1)]
+    lat, lon = random_cities(args.cities)
+    dates = pd.date_range(start='2020-01-01', periods=round(365.25 * args.years), freq='D')
+    print(f"{args.cities} cities x {len(dates)} days, {cpus} CPUs available")
+
+    baseline, expected = timed(solar_position.solar_events, lat, lon, dates, repeats=args.repeats)
+    print(f"{'workers':>7} | {'seconds':>7} | {'speedup':>7} | {'efficiency':>10} | identical")
+    print(f"{'inline':>7} | {baseline:7.2f} | {1:7.2f} | {1:10.0%} | yes")
+    for n_workers in workers:
+        seconds, result = timed(solar_parallel.solar_events_parallel, lat, lon, dates, workers=n_workers,
+                                repeats=args.repeats)
+        identical = all(np.array_equal(expected[key], result[key], equal_nan=True) for key in expected)
+        speedup = baseline / seconds
+        print(f"{n_workers:>7} | {seconds:7.2f} | {speedup:7.2f} | {speedup / n_workers:10.0%} | "
+              f"{'yes' if identical else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
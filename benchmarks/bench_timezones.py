@@ -0,0 +1,49 @@
+"""
+Measures the throughput of timezones.TimezoneResolver against per-point timezonefinder lookups on random
+points within the EU bounding box, and checks that both agree on the zone of every point.
+
+Run from the repository root:
+    python -m benchmarks.bench_timezones [--points 1000000] [--check 20000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import timezones
+
+EU_LAT_RANGE = (35.0, 70.0)
+EU_LON_RANGE = (-10.0, 35.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=1_000_000, help='Number of random points to resolve')
+    parser.add_argument('--check', type=int, default=20_000,
+                        help='Number of points also resolved with timezonefinder, one at a time')
+    args = parser.parse_args()
+    from timezonefinder import TimezoneFinder
+
+    rng = np.random.default_rng(0)
+    lon, lat = rng.uniform(*EU_LON_RANGE, args.points), rng.uniform(*EU_LAT_RANGE, args.points)
+
+    start = time.perf_counter()
+    resolver = timezones.get_resolver()
+    print(f"resolver build   {time.perf_counter() - start:8.2f} s")
+
+    start = time.perf_counter()
+    zones = resolver.zones(lon, lat)
+    seconds = time.perf_counter() - start
+    print(f"resolver bulk    {seconds:8.2f} s  {args.points / seconds:12,.0f} points/s")
+
+    tf = TimezoneFinder()
+    n = min(args.check, args.points)
+    start = time.perf_counter()
+    expected = [tf.timezone_at_land(lng=x, lat=y) or '' for x, y in zip(lon[:n], lat[:n])]
+    seconds = time.perf_counter() - start
+    print(f"timezonefinder   {seconds:8.2f} s  {n / seconds:12,.0f} points/s")
+    print(f"agreement        {np.mean(zones[:n] == np.array(expected)):8.4%} of {n} points")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Incremental build of the artifacts in datasets/saved.
+
+Each stage declares its input files, upstream stages, parameters and source modules. A stage is only
+rebuilt if the hash over all of these differs from the hash recorded at its last build, and outputs
+are written atomically, so an interrupted build never leaves half written files behind.
+
+Usage:
+    python build_data.py                 # Rebuild all stale stages
+    python build_data.py sunrise_data    # Rebuild the given stages (and stale upstream stages) only
+    python build_data.py --dry-run       # Show which stages are stale
+    python build_data.py --force         # Rebuild everything
+    python build_data.py --trace         # Also print where the time went and write a trace, see tracing.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+import geocoding
+import tracing
+
+BUILD_STATE_PATH = 'datasets/cache/build_state.json'
+
+EU_GPD_PATH = 'datasets/saved/eu_gpd.geojson'
+CITY_DATA_PATH = 'datasets/saved/city_data.csv'
+AVG_COUNTRY_PATH = 'datasets/saved/avg_country.csv'
+SUNRISE_DATA_PATH = 'datasets/saved/sunrise_data.csv'
+EU_GEO_TZ_PATH = 'datasets/saved/eu_geo_tz.geojson'
+MAP_STATE_PATH = 'datasets/saved/eu_map_state.npz'
+DAILY_STATE_PATH = 'datasets/saved/eu_daily.npz'
+
+EUROSTAT_TSV_PATH = 'datasets/Eurostat/urban_population/urb_cpop1_page_tabular_full.tsv'
+EUROSTAT_CODES_PATH = 'datasets/Eurostat/urban_population/urb_esms_an4.xlsx'
+COUNTRY_CODES_PATH = 'datasets/saved/eu_country_codes.csv'
+TIMEZONES_PATH = 'datasets/saved/timezones_eu.csv'
+GAZETTEER_PATH = 'datasets/saved/gazetteer.csv'
+
+
+class Stage(NamedTuple):
+    name: str
+    outputs: list[str]
+    upstream: list[str]  # Names of stages whose outputs are read
+    inputs: list[str]  # Source files that are not produced by another stage
+    code: list[str]  # Modules whose source changes invalidate the stage
+    params: Callable[[argparse.Namespace], dict]
+    run: Callable[[argparse.Namespace], dict]  # Returns a mapping of output path to the object to write
+
+
+def _build_eu_gpd(args):
+    from geo_utils import load_eu_countries_as_geopandas
+    return {EU_GPD_PATH: load_eu_countries_as_geopandas()}
+
+
+def _build_city_data(args):
+    from geo_utils import get_eu_city_data
+    return {CITY_DATA_PATH: get_eu_city_data(args.top_n_pop)}
+
+
+def _build_avg_country(args):
+    import geopandas as gpd
+    import pandas as pd
+    from geo_utils import get_avg_country_data
+    return {AVG_COUNTRY_PATH: get_avg_country_data(pd.read_csv(CITY_DATA_PATH), gpd.read_file(EU_GPD_PATH))}
+
+
+def _build_sunrise_data(args):
+    import pandas as pd
+    from sun_data import get_sunrise_data_avgs_for_countries
+    return {SUNRISE_DATA_PATH: get_sunrise_data_avgs_for_countries(pd.read_csv(CITY_DATA_PATH))}
+
+
+def _build_eu_geo_tz(args):
+    import geopandas as gpd
+    import pandas as pd
+    eu_geo_tz = gpd.read_file(EU_GPD_PATH).merge(pd.read_csv(AVG_COUNTRY_PATH))
+    eu_geo_tz = eu_geo_tz.merge(pd.read_csv(SUNRISE_DATA_PATH), left_on=['iso_a2', 'dst'],
+                                right_on=['country_ISO_A2', 'dst'])
+    return {EU_GEO_TZ_PATH: eu_geo_tz}
+
+
+def _build_map_state(args):
+    import geopandas as gpd
+    from map_state import build_map_state
+    return {MAP_STATE_PATH: build_map_state(gpd.read_file(EU_GEO_TZ_PATH))}
+
+
+def _build_daily_state(args):
+    import pandas as pd
+    from daily_data import build_daily_state
+    return {DAILY_STATE_PATH: build_daily_state(pd.read_csv(CITY_DATA_PATH))}
+
+
+def _geo_utils_params(args):
+    import geo_utils
+    import sun_data
+    # The standard time of each city's timezone is taken from the rules of sun_data.YEAR
+    return {'ADJUST_LOCAL_SUMMERTIME': geo_utils.ADJUST_LOCAL_SUMMERTIME, 'YEAR': sun_data.YEAR}
+
+
+def _sun_data_params(args):
+    import sun_data
+    return {'YEAR': sun_data.YEAR, 'LAST_SUNDAY_OF_MARCH': sun_data.LAST_SUNDAY_OF_MARCH,
+            'LAST_SUNDAY_OF_OCTOBER': sun_data.LAST_SUNDAY_OF_OCTOBER, 'SUN_BACKEND': sun_data.SUN_BACKEND}
+
+
+def _daily_data_params(args):
+    import daily_data
+    import sun_data
+    return {'YEAR': sun_data.YEAR, 'DAILY_YEARS': daily_data.DAILY_YEARS}
+
+
+# Ordered topologically, every stage only depends on stages listed before it
+STAGES = [
+    Stage('eu_gpd', [EU_GPD_PATH], [], [COUNTRY_CODES_PATH], ['geo_utils.py'],
+          lambda args: {}, _build_eu_gpd),
+    Stage('city_data', [CITY_DATA_PATH], [],
+          [EUROSTAT_TSV_PATH, EUROSTAT_CODES_PATH, COUNTRY_CODES_PATH, TIMEZONES_PATH, GAZETTEER_PATH],
+          ['geo_utils.py', 'eurostat.py', 'geocoding.py', 'geometry.py', 'timezones.py'],
+          lambda args: {'top_n_pop': args.top_n_pop, **_geo_utils_params(args)}, _build_city_data),
+    Stage('avg_country', [AVG_COUNTRY_PATH], ['city_data', 'eu_gpd'], [], ['geo_utils.py'],
+          lambda args: {}, _build_avg_country),
+    Stage('sunrise_data', [SUNRISE_DATA_PATH], ['city_data'], [],
+          ['sun_data.py', 'solar_position.py', 'solar_parallel.py', 'dst_scenarios.py'], _sun_data_params,
+          _build_sunrise_data),
+    Stage('eu_geo_tz', [EU_GEO_TZ_PATH], ['eu_gpd', 'avg_country', 'sunrise_data'], [], ['build_data.py'],
+          lambda args: {}, _build_eu_geo_tz),
+    Stage('map_state', [MAP_STATE_PATH], ['eu_geo_tz'], [], ['map_state.py', 'geo_simplify.py'],
+          lambda args: {}, _build_map_state),
+    Stage('daily_state', [DAILY_STATE_PATH], ['city_data'], [],
+          ['daily_data.py', 'solar_position.py', 'dst_scenarios.py'], _daily_data_params, _build_daily_state),
+]
+STAGES_BY_NAME = {s.name: s for s in STAGES}
+
+
+def build(args: argparse.Namespace) -> list[str]:
+    """
+    Rebuilds all stale stages needed for the requested targets.
+    :param args: Parsed command line arguments, see _parse_args.
+    :return: Returns the names of the stages that were (or with --dry-run would be) rebuilt.
+    """
+    state = _load_state()
+    needed = _stages_needed_for(args.targets or [s.name for s in STAGES])
+    rebuilt = []
+    for stage in STAGES:
+        if stage.name not in needed:
+            continue
+        key = stage_key(stage, args)
+        outputs_exist = all(os.path.exists(p) for p in stage.outputs)
+        # Without actually building, outputs of stale upstream stages cannot be hashed yet
+        upstream_pending = args.dry_run and any(name in rebuilt for name in stage.upstream)
+        if not args.force and outputs_exist and not upstream_pending and state.get(stage.name) == key:
+            print(f"[up to date] {stage.name}")
+            continue
+
+        print(f"[rebuild]    {stage.name}")
+        rebuilt.append(stage.name)
+        if args.dry_run:
+            continue
+        with tracing.span(f'build_data.{stage.name}'), warnings.catch_warnings(record=True) as caught:
+            outputs = stage.run(args)
+        for w in caught:
+            warnings.showwarning(w.message, w.category, w.filename, w.lineno)
+        for path, obj in outputs.items():
+            write_atomic(obj, path)
+        if any(issubclass(w.category, geocoding.GeocodeMissWarning) for w in caught):
+            # Cities that failed to geocode (e.g. without network) are retried, so the stage stays stale
+            print(f"[incomplete] {stage.name}, it is rebuilt on the next run")
+            continue
+        state[stage.name] = key
+        _save_state(state)  # Save after every stage, so finished stages survive a failure further down
+    return rebuilt
+
+
+def stage_key(stage: Stage, args: argparse.Namespace) -> str:
+    """
+    Hashes everything a stage output depends on: the content of its input files and upstream outputs,
+    its parameters and the source of its modules. Upstream outputs are hashed by content, so a rebuilt
+    upstream stage with unchanged output does not invalidate the stages after it.
+    :param stage: The stage to hash.
+    :param args: Parsed command line arguments, used to resolve the stage parameters.
+    :return: Returns the hex digest of the stage key.
+    """
+    files = stage.inputs + [p for name in stage.upstream for p in STAGES_BY_NAME[name].outputs] + stage.code
+    h = hashlib.sha256()
+    h.update(json.dumps(stage.params(args), sort_keys=True, default=str).encode())
+    for path in files:
+        h.update(path.encode())
+        h.update(file_hash(path).encode())
+    return h.hexdigest()
+
+
+def file_hash(path: str) -> str:
+    if not os.path.exists(path):
+        return 'missing'
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_atomic(obj, path: str):
+    """
+    Writes a DataFrame (CSV), GeoDataFrame (GeoJSON) or dict of arrays (NPZ) to a temporary file next to path
+    and then moves it into place, so readers either see the old or the new file.
+    :param obj: pd.DataFrame, gpd.GeoDataFrame or dict of np.ndarray to write.
+    :param path: Destination path, the suffix decides the format.
+    """
+    directory, suffix = os.path.dirname(path) or '.', Path(path).suffix
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix=suffix)
+    os.close(fd)
+    try:
+        if suffix == '.geojson':
+            os.remove(tmp_path)  # The GeoJSON driver refuses to overwrite existing files
+            obj.to_file(tmp_path, driver='GeoJSON', index=False)
+        elif suffix == '.npz':
+            np.savez_compressed(tmp_path, **obj)
+        else:
+            obj.to_csv(tmp_path, index=False)
+        os.chmod(tmp_path, _output_mode())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _output_mode() -> int:
+    # mkstemp creates files readable by the owner only, outputs get the default mode of new files instead
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _stages_needed_for(targets: list[str]) -> set[str]:
+    needed = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in STAGES_BY_NAME:
+            raise SystemExit(f"Unknown stage '{name}', choose from {', '.join(STAGES_BY_NAME)}")
+        if name not in needed:
+            needed.add(name)
+            todo.extend(STAGES_BY_NAME[name].upstream)
+    return needed
+
+
+def _load_state() -> dict:
+    if not os.path.exists(BUILD_STATE_PATH):
+        return {}
+    with open(BUILD_STATE_PATH) as f:
+        return json.load(f)
+
+
+def _save_state(state: dict):
+    Path(BUILD_STATE_PATH).parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(BUILD_STATE_PATH), prefix='.tmp_')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, BUILD_STATE_PATH)
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Incrementally rebuild the artifacts in datasets/saved.')
+    parser.add_argument('targets', nargs='*', help=f"Stages to build, any of: {', '.join(STAGES_BY_NAME)}")
+    parser.add_argument('--top-n-pop', type=int, default=3, help='Number of cities per country (default: 3)')
+    parser.add_argument('--force', action='store_true', help='Rebuild all requested stages')
+    parser.add_argument('--dry-run', action='store_true', help='Only show which stages would be rebuilt')
+    parser.add_argument('--trace', nargs='?', const=tracing.DEFAULT_TRACE_PATH, metavar='PATH',
+                        help='Record spans and counters of the build to a Chrome trace JSON file '
+                             f'(default: {tracing.DEFAULT_TRACE_PATH})')
+    return parser.parse_args(argv)
+
+
+def _print_trace_summary():
+    print(f"{'span':<56} {'calls':>6} {'seconds':>8}")
+    for name, calls, seconds in tracing.summary():
+        print(f"{name:<56} {calls:6} {seconds:8.3f}")
+    for name, total in tracing.counters().items():
+        print(f"{name:<56} {total:15,}")
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.trace:
+        tracing.enable()
+    build(args)
+    if args.trace:
+        _print_trace_summary()
+        print(f"Trace written to {tracing.export(args.trace)}")
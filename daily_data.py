@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+import dst_scenarios
+import solar_position
+import sun_data
+
+DAILY_YEARS = 10  # Number of years of daily data, starting at sun_data.YEAR
+SERIES = ('sunrise', 'sunset', 'daylight')
+STATISTICS = ('mean', 'min', 'max')
+MISSING_MINUTES = np.iinfo('int16').min  # Marks days without sunrise/sunset in the stored daily state
+
+
+def get_daily_country_data(city_data: pd.DataFrame, dates, dst_rule: str = dst_scenarios.EU_RULE) -> dict:
+    """
+    Calculates sunrise, sunset and daylight of every day for every country from its cities in one vectorized pass.
+    :param city_data: Dataframe with the columns country_ISO_A2, latitude, longitude, population and
+    utc_sun_timezone_offset, as returned by geo_utils.get_eu_city_data.
+    :param dates: Array-like of days (m days), anything accepted by pd.DatetimeIndex.
+    :param dst_rule: DST rule of the local clock times, see dst_scenarios.dst_active.
+    :return: Returns a dict with 'x' (the days as float milliseconds since epoch, the unit of Bokeh datetime axes),
+    'countries' (the k ISO_A2 codes) and for each series in SERIES and statistic in STATISTICS a (k, m) float
+    array '<series>_<statistic>': sunrise and sunset as local clock time in hours, daylight as duration in hours,
+    the population weighted mean over the cities of each country and the min. and max. city.
+    Sunrise and sunset are NaN on days without them (polar day/night), daylight is 24 or 0 hours there.
+    """
+    dates = pd.DatetimeIndex(dates)
+    events = solar_position.solar_events(city_data['latitude'], city_data['longitude'], dates)
+    utc_offset_h = city_data['utc_sun_timezone_offset'].to_numpy(dtype='float64')[:, np.newaxis] + \
+        dst_scenarios.dst_active(dates, dst_rule)[np.newaxis, :]
+    city_series = {
+        'sunrise': events['sunrise'] / 60 + utc_offset_h,
+        'sunset': events['sunset'] / 60 + utc_offset_h,
+        'daylight': np.select([events['polar'] == solar_position.POLAR_DAY,
+                               events['polar'] == solar_position.POLAR_NIGHT],
+                              [24.0, 0.0], (events['sunset'] - events['sunrise']) / 60),
+    }
+
+    countries, country_idx = np.unique(city_data['country_ISO_A2'].to_numpy(dtype=str), return_inverse=True)
+    population = city_data['population'].to_numpy(dtype='float64')
+    daily = {'x': dates.values.astype('datetime64[ms]').astype('float64'), 'countries': countries}
+    for series, values in city_series.items():
+        stats = {stat: np.empty((len(countries), len(dates))) for stat in STATISTICS}
+        for i in range(len(countries)):
+            country_values = values[country_idx == i]
+            weights = np.where(np.isnan(country_values), 0.0, population[country_idx == i, np.newaxis])
+            with np.errstate(invalid='ignore'):  # Days without sunrise in all cities of a country stay NaN
+                stats['mean'][i] = np.nansum(country_values * weights, axis=0) / weights.sum(axis=0)
+            # fmin/fmax ignore NaN without warning about days that are NaN in all cities
+            stats['min'][i] = np.fmin.reduce(country_values, axis=0)
+            stats['max'][i] = np.fmax.reduce(country_values, axis=0)
+        daily.update({f'{series}_{stat}': stats[stat] for stat in STATISTICS})
+    return daily
+
+
+def get_daily_dates(years: int = DAILY_YEARS) -> pd.DatetimeIndex:
+    """
+    :param years: Number of years.
+    :return: Returns all days of the given number of years, starting on the 1st of January of sun_data.YEAR.
+    """
+    return pd.date_range(start=f'{sun_data.YEAR}-01-01', end=f'{sun_data.YEAR + years - 1}-12-31', freq='D')
+
+
+def build_daily_state(city_data: pd.DataFrame, years: int = DAILY_YEARS) -> dict[str, np.ndarray]:
+    """
+    Compiles the per day data shown by the daily chart of index.py into compact arrays, so the app only loads
+    them instead of calculating the solar positions of all cities. Values are stored as whole minutes (int16,
+    MISSING_MINUTES for NaN) in local standard time, together with the days on which the EU DST rule adds
+    one hour to the clock times.
+    :param city_data: Dataframe as returned by geo_utils.get_eu_city_data.
+    :param years: Number of years, see get_daily_dates.
+    :return: Returns a dict of arrays with the keys 'x', 'countries', 'dst_active' and '<series>_<statistic>'
+    as in get_daily_country_data, see index.get_daily_data (load_saved_state, get_daily_variant) for reading it back.
+    """
+    dates = get_daily_dates(years)
+    daily = get_daily_country_data(city_data, dates, dst_scenarios.NO_DST)
+    state = {'x': daily['x'], 'countries': daily['countries'],
+             'dst_active': dst_scenarios.dst_active(dates, dst_scenarios.EU_RULE).astype('int8')}
+    for series in SERIES:
+        for stat in STATISTICS:
+            minutes = np.rint(daily[f'{series}_{stat}'] * 60)
+            state[f'{series}_{stat}'] = np.where(np.isnan(minutes), MISSING_MINUTES, minutes).astype('int16')
+    return state
@@ -15,7 +15,7 @@ async function startApplication() {
   self.pyodide.globals.set("sendPatch", sendPatch);
   console.log("Loaded!");
   await self.pyodide.loadPackage("micropip");
-  const env_spec = ['https://cdn.holoviz.org/panel/1.0.3/dist/wheels/bokeh-3.1.1-py3-none-any.whl', 'https://cdn.holoviz.org/panel/1.0.3/dist/wheels/panel-1.0.3-py3-none-any.whl', 'pyodide-http==0.2.1', 'geopandas', 'pandas']
+  const env_spec = ['https://cdn.holoviz.org/panel/1.0.3/dist/wheels/bokeh-3.1.1-py3-none-any.whl', 'https://cdn.holoviz.org/panel/1.0.3/dist/wheels/panel-1.0.3-py3-none-any.whl', 'pyodide-http==0.2.1', 'numpy', 'pandas']
   for (const pkg of env_spec) {
     let pkg_name;
     if (pkg.endsWith('.whl')) {
@@ -47,160 +47,567 @@ from panel.io.pyodide import init_doc, write_doc
 
 init_doc()
 
-from bokeh.plotting import figure
-from bokeh.models import GeoJSONDataSource, LinearColorMapper, ColorBar, ColumnDataSource, LabelSet, HoverTool
-from bokeh.tile_providers import Vendors
+import io
+import os
+import sys
+import threading
+import urllib.parse
+import urllib.request
+
 from bokeh.models import DataTable, TableColumn
-from bokeh.palettes import Plasma256
+import pandas as pd
+from bokeh.plotting import figure
+from bokeh.models import CategoricalColorMapper, ColorBar, ColumnDataSource, LabelSet, HoverTool, Range1d
+from bokeh.core.property.descriptors import UnsetValueError
+from bokeh.events import RangesUpdate
+from bokeh.tile_providers import get_provider, Vendors
 from bokeh.palettes import brewer
-import json
 import panel as pn
-from datetime import date
-import geopandas as gpd
-import pandas as pd
-
-eu_data_path = 'https://raw.githubusercontent.com/pvonderlind/CircadianRythmEU/master/datasets/saved/eu_gpd.geojson'
-city_data_path = 'https://raw.githubusercontent.com/pvonderlind/CircadianRythmEU/master/datasets/saved/city_data.csv'
-sunset_data = 'https://raw.githubusercontent.com/pvonderlind/CircadianRythmEU/master/datasets/saved/sunset_data_2022.geojson'
-
-eu_gpd = gpd.read_file(eu_data_path)
-top_city_data = pd.read_csv(city_data_path)
-sun_data_gpd = gpd.read_file(sunset_data)
-
-data_field = 'sunrise_UTC'
-bokeh_tools = 'wheel_zoom, pan, box_zoom, reset'
+import numpy as np
+
+# panel convert only bundles this script and treats every import as a package to install in Pyodide, so the app
+# must not import the local modules of this repository. It reads the files compiled by build_data.py instead
+# (see map_state.py and daily_data.py), from datasets/saved or, in the Pyodide build, from next to the page (docs/).
+map_state_path = 'datasets/saved/eu_map_state.npz'
+daily_state_path = 'datasets/saved/eu_daily.npz'
+saved_files_url = 'https://raw.githubusercontent.com/pvonderlind/CircadianRythmEU/master'  # If not found locally
+map_table_prefix = 'table_'  # Same as map_state.TABLE_PREFIX
+map_geometry_prefix = 'geom_'  # Same as map_state.GEOMETRY_PREFIX
+
+data_field = 'social_timezone'
+bokeh_tools = 'wheel_zoom, pan, box_zoom, reset, save'
 colorbar_settings = {'title_text_font_size': '12pt', 'label_standoff': 12}
+length_scale = 100000
+divider_len = 50000
+
+# Country outlines are loaded coarse and refined when zooming in: (tier, max. visible x range width in meters)
+lod_tiers = [('full', 1.5 * 10 ** 6), ('medium', 4 * 10 ** 6)]
+lod_start_tier = 'coarse'
+
+# Daily chart: the browser only receives about daily_points_per_pixel points per pixel of the visible x range
+daily_plot_width = 1000  # Used until the browser reported the actual width
+daily_points_per_pixel = 2
+daily_series_colors = {'sunrise': '#fdae61', 'sunset': '#d7191c', 'daylight': '#2b83ba'}
+daily_clock_series = ('sunrise', 'sunset')  # Local clock times, one hour later on days with DST
+
+# panel serve runs this script in a new module for every session, so data shared between sessions is kept in
+# pn.state.cache (one per process) under keys starting with result_cache_prefix
+result_cache_prefix = 'index'
+result_cache_size = 32  # Max. number of entries, the least recently used entry is evicted first
+
+
+def _result_cache_lock() -> threading.Lock:
+    # A module level lock would be created again for every session, the lock has to be shared like the cache
+    return pn.state.cache.setdefault(f'{result_cache_prefix}_lock', threading.Lock())
+
+
+def cached_result(key: tuple, build):
+    """
+    Looks up a result shared by all sessions of this process in pn.state.cache, builds and stores it on a miss.
+    :param key: Hashable tuple identifying the result.
+    :param build: Callable without arguments computing the result.
+    :return: Returns the cached result. It is shared between sessions, so treat it as read-only.
+    """
+    cache = pn.state.cache
+    key = (result_cache_prefix, *key)
+    lock = _result_cache_lock()
+    with lock:
+        if key in cache:
+            cache[key] = cache.pop(key)  # Reinsert to mark it as most recently used
+            return cache[key]
+    result = build()
+    with lock:
+        cache[key] = result
+        # list() copies the keys at once, other users of pn.state.cache do not take the lock
+        own_keys = [k for k in list(cache) if isinstance(k, tuple) and k[:1] == (result_cache_prefix,)]
+        for old_key in own_keys[:-result_cache_size]:
+            del cache[old_key]
+    return result
+
+
+def clear_result_cache():
+    """
+    Removes all results of this module from pn.state.cache, e.g. after the data in datasets/saved was rebuilt.
+    """
+    with _result_cache_lock():
+        for key in [k for k in list(pn.state.cache) if isinstance(k, tuple) and k[:1] == (result_cache_prefix,)]:
+            del pn.state.cache[key]
+
+
+def get_map_data() -> dict:
+    """
+    :return: Returns the precompiled eu_geo_tz (see map_state.py), loaded on first use.
+    """
+    return cached_result(('map_state',), lambda: load_saved_state(map_state_path))
+
+
+def get_country_data() -> pd.DataFrame:
+    """
+    :return: Returns the eu_geo_tz attribute table, one row per country and DST setting. Treat it as read-only.
+    """
+    return cached_result(('country_data',), lambda: state_table(get_map_data()))
+
+
+def get_toggle_variant(dst: bool, winter_period_active: bool) -> dict:
+    """
+    :return: Returns the map variant of the given DST and period toggle values, see get_map_variant.
+    """
+    return cached_result(('variant', dst, winter_period_active),
+                         lambda: get_map_variant(get_country_data(), dst, winter_period_active))
+
+
+def get_toggle_variants() -> dict:
+    """
+    :return: Returns a dict mapping (dst, winter_period_active) to the map variants of all toggle combinations.
+    """
+    return {(dst, winter_period_active): get_toggle_variant(dst, winter_period_active)
+            for dst in (False, True) for winter_period_active in (False, True)}
+
+
+def get_daily_state() -> dict:
+    """
+    :return: Returns the precompiled per day data of the daily chart (see daily_data.build_daily_state),
+    loaded on first use.
+    """
+    return cached_result(('daily_state',), lambda: load_saved_state(daily_state_path))
+
+
+def get_daily_data(dst: bool) -> dict:
+    """
+    :param dst: Whether the local times follow the EU DST rules or permanent standard time.
+    :return: Returns the per day sunrise, sunset and daylight of all countries, see get_daily_variant.
+    """
+    return cached_result(('daily', dst), lambda: get_daily_variant(get_daily_state(), dst))
+
+
+def open_saved_file(path: str):
+    """
+    :param path: Local path of a file in datasets/saved.
+    :return: Returns the file opened in binary mode. If it does not exist locally it is downloaded, in the
+    Pyodide build from next to the page, otherwise from saved_files_url.
+    """
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        if 'pyodide' in sys.modules:
+            # Panel patches urllib to use the browser's fetch in Pyodide (pyodide-http)
+            from js import location
+            url = urllib.parse.urljoin(str(location.href), os.path.basename(path))
+        else:
+            url = f'{saved_files_url}/{path}'
+        with urllib.request.urlopen(url) as response:
+            return io.BytesIO(response.read())
+
+
+def load_saved_state(path: str) -> dict[str, np.ndarray]:
+    """
+    :param path: Path of a .npz file written by build_data.py, see open_saved_file.
+    :return: Returns a dict of its arrays.
+    """
+    with open_saved_file(path) as source, np.load(source, allow_pickle=False) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def state_table(state: dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    :param state: Map state as returned by get_map_data.
+    :return: Returns the attribute table of eu_geo_tz (without geometry) as a dataframe.
+    """
+    return pd.DataFrame({key[len(map_table_prefix):]: values for key, values in state.items()
+                         if key.startswith(map_table_prefix)})
+
+
+def state_patches(state: dict[str, np.ndarray], tier: str) -> tuple[np.ndarray, list[np.ndarray], list[np.ndarray]]:
+    """
+    :param state: Map state as returned by get_map_data.
+    :param tier: Level of detail tier, see map_state.SIMPLIFY_TOLERANCES.
+    :return: Returns the ISO_A2 codes of the countries and a list of x and y patch coordinate arrays for each.
+    """
+    offsets = state[f'{map_geometry_prefix}{tier}_offsets']
+    x = state[f'{map_geometry_prefix}{tier}_x'].astype('float64')
+    y = state[f'{map_geometry_prefix}{tier}_y'].astype('float64')
+    xs = [x[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    ys = [y[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return state[map_geometry_prefix + 'iso_a2'], xs, ys
+
+
+def get_daily_variant(state: dict[str, np.ndarray], dst: bool) -> dict:
+    """
+    :param state: Daily state as returned by get_daily_state, whole minutes in local standard time.
+    :param dst: Whether the clock times follow the EU DST rules (one hour later on the days marked in
+    state['dst_active']) or permanent standard time.
+    :return: Returns a dict with 'x' (the days as float milliseconds since epoch), 'countries' (the k ISO_A2 codes)
+    and a (k, m) float array of hours for every '<series>_<statistic>', NaN on days without sunrise/sunset.
+    """
+    daily = {'x': state['x'], 'countries': state['countries']}
+    for key, minutes in state.items():
+        series = key.split('_')[0]
+        if series not in daily_series_colors:
+            continue
+        hours = np.where(minutes == np.iinfo(minutes.dtype).min, np.nan, minutes / 60)
+        if dst and series in daily_clock_series:
+            hours = hours + state['dst_active']
+        daily[key] = hours
+    return daily
+
+
+def get_patch_data(tier: str = lod_start_tier) -> dict:
+    """
+    :param tier: Level of detail of the country outlines, see lod_tiers.
+    :return: Returns the data of the country patch source at the given tier.
+    """
+    return cached_result(('patches', tier), lambda: get_patch_source_data(get_map_data(), get_country_data(), tier))
+
+
+def get_country_table_data() -> dict:
+    """
+    :return: Returns the data of the country table source, sorted and with formatted sunrise times.
+    """
+    return cached_result(('country_table',), lambda: get_country_table_source_data(get_country_data()))
+
+
+def get_lod_tier(x_range_width: float) -> str:
+    for tier, max_width in lod_tiers:
+        if x_range_width <= max_width:
+            return tier
+    return lod_start_tier
+
+
+def get_bokeh_patch_source(tier: str = lod_start_tier):
+    # A new source per session, the cached columns are shared and replaced (never modified) on updates
+    return ColumnDataSource(dict(get_patch_data(tier)))
+
+
+def get_patch_source_data(state, country_data, tier: str) -> dict:
+    iso_a2, xs, ys = state_patches(state, tier)
+    country_data = country_data.drop_duplicates('iso_a2').set_index('iso_a2').loc[iso_a2]
+    return dict(xs=xs, ys=ys, iso_a2=iso_a2, name=country_data['name'].to_numpy(),
+                social_timezone=country_data[data_field].to_numpy())
+
+
+def get_map_variant(country_data, dst: bool, winter_period_active: bool) -> dict:
+    """
+    Computes the data of all sources that change with the DST and period toggles.
+    :param country_data: The eu_geo_tz attribute table, one row per country and DST setting.
+    :param dst: Value of the DST toggle.
+    :param winter_period_active: Value of the period toggle.
+    :return: Returns a dict with the data of the bar and divider sources and the population weighted
+    avg. time difference to 9:00.
+    """
+    data = country_data[country_data['dst'] == dst]
+    time_diff_col = data['winter_diff_h' if winter_period_active else 'summer_diff_h']
+    return {
+        'bars': get_bar_data(data, time_diff_col, winter_period_active),
+        'dividers': get_divider_data(data, time_diff_col),
+        'weighted_avg': (data['pop_percent'] * time_diff_col).sum()
+    }
 
 
-def get_bokeh_geodata_source(gpd_df):
-    json_data = json.dumps(json.loads(gpd_df.to_json()))
-    return GeoJSONDataSource(geojson=json_data)
-
-
-def bokeh_plot_map(data):
+def get_bar_data(data, time_diff_col, winter_period_active: bool) -> dict:
+    return dict(
+        x0=data['mercantor_x'].to_numpy(),
+        y0=data['mercantor_y'].to_numpy(),
+        x1=(data['mercantor_x'] + (length_scale * time_diff_col)).to_numpy(),
+        y1=data['mercantor_y'].to_numpy(),
+        lwd=(1 + data['pop_norm'] * 10).to_numpy(),
+        l_col=_bar_colors(time_diff_col),
+        avg_sunrise=data['winter_period' if winter_period_active else 'summer_period'].to_numpy(),
+        time_diff=time_diff_col.to_numpy(),
+        country=data['name'].to_numpy(),
+        pop_percent=(data['pop_percent'] * 100).to_numpy(),
+        long_diff=data['mean_longitudinal_diff_km'].to_numpy(),
+        weighted_long_diff=data['weighted_mean_longdiff'].to_numpy(),
+        long_diff_norm=data['norm_weighted_mean_longdiff'].to_numpy(),
+        text=data['name'].to_numpy(),
+        text_y=((data['mercantor_y'] + divider_len / 2) + 1000).to_numpy()
+    )
+
+
+def get_divider_data(data, time_diff_col) -> dict:
+    return dict(
+        x0=data['mercantor_x'].to_numpy(),
+        y0=(data['mercantor_y'] - divider_len / 2).to_numpy(),
+        x1=data['mercantor_x'].to_numpy(),
+        y1=(data['mercantor_y'] + divider_len / 2).to_numpy(),
+        l_col=_bar_colors(time_diff_col)
+    )
+
+
+def _bar_colors(time_diff_col) -> np.ndarray:
+    return np.where(np.sign(time_diff_col) < 0, '#ff0000', 'blue')
+
+
+def bokeh_plot_map(patch_source, bar_data_source, divider_data_source):
     p = figure(toolbar_location='right', tools=bokeh_tools, active_scroll="wheel_zoom",
-               title="Distance to eastern timezone meridian for large EU cities",
-               x_range=(top_city_data['mercantor_x'].min(), top_city_data['mercantor_x'].max()))
+               title="Time difference between sunrise and 9:00 for EU countries",
+               x_range=(-1.3 * 10 ** 6, 4 * 10 ** 6),
+               y_range=(4 * 10 ** 6, 9 * 10 ** 6))
     p.title.text_font_size = '20px'
     p.xgrid.grid_line_color = None
     p.ygrid.grid_line_color = None
 
-    # AD MAP TILES ---------------------------------------------------------------------------
+    # ADD MAP TILES ---------------------------------------------------------------------------
     p.add_tile(Vendors.CARTODBPOSITRON_RETINA)
 
-    # ADD GEO STUFF FOR COUNTRIES AS A WHOLE -------------------------------------------------
-    geo_data_source = get_bokeh_geodata_source(data)
+    # ADD TIMEZONE LINES
 
-    values = data[data_field]
-    palette = brewer['OrRd'][8]
+    # ADD GEO STUFF FOR COUNTRIES AS A WHOLE -------------------------------------------------
+    values = pd.Series(patch_source.data[data_field])
+    palette = brewer['OrRd'][3]
     palette = palette[::-1]
-    # Instantiate LinearColorMapper that linearly maps numbers in a range, into a sequence of colors.
-    color_mapper = LinearColorMapper(palette=palette, low=values.min(), high=values.max())
-    color_bar = ColorBar(color_mapper=color_mapper, location=(0, 0), title='Sunrise (UTC)', **colorbar_settings)
-    country_suntimes = p.patches('xs', 'ys', source=geo_data_source,
-                                 fill_color={'field': data_field, 'transform': color_mapper},
-                                 line_color='blue',
-                                 line_width=0.5,
-                                 fill_alpha=0.8)
+    color_mapper = CategoricalColorMapper(palette=palette, factors=values.unique().tolist())
+    color_bar = ColorBar(color_mapper=color_mapper, location=(0, 0), title='Timezone', **colorbar_settings)
+    country_tz = p.patches('xs', 'ys', source=patch_source,
+                           fill_color={'field': data_field, 'transform': color_mapper},
+                           line_color='blue',
+                           line_width=0.5,
+                           fill_alpha=0.8)
     p.add_layout(color_bar, 'below')
 
-    # TOOLTIPS FOR COUNTRY PATCHES
-    tooltips_country = [
-        ('Country', '@iso_a3'),
-        ('Sunrise (UTC)', '@sunrise_UTC'),
-        ('Sunset (UTC)', '@sunset_UTC')
-    ]
-    p.add_tools(HoverTool(renderers=[country_suntimes], tooltips=tooltips_country))
-
     # ===================================================================================================================
 
-    # ADD TIMEZONE INFO PER TOP N CITIES FOR EACH COUNTRY ------------------------------------
-
-    city_data_source = ColumnDataSource(data=top_city_data)
-    city_color_mapper = LinearColorMapper(palette=Plasma256,
-                                          low=top_city_data['longitudinal_diff_km'].min(),
-                                          high=top_city_data['longitudinal_diff_km'].max())
-    city_color_bar = ColorBar(color_mapper=city_color_mapper, location=(0, 0),
-                              title="Distance to east timezone meridian (Km)", **colorbar_settings)
-    city_longdiff_circles = p.circle(x='mercantor_x', y='mercantor_y', source=city_data_source,
-                                     color={'field': 'longitudinal_diff_km', 'transform': city_color_mapper}, size=10,
-                                     fill_alpha=1)
-    labels = LabelSet(x='mercantor_x', y='mercantor_y', x_offset=5, y_offset=5, text='NAME', source=city_data_source,
-                      text_color='cornflowerblue')
-
-    p.add_layout(labels)
-    p.add_layout(city_color_bar, 'right')
+    # ADD BARS FOR DISTANCE TO EAST MERIDIAN EFFECT
+    longdiff_quads = p.segment(x0="x0", y0="y0", x1="x1", y1="y1", line_width="lwd", line_color='l_col',
+                               source=bar_data_source)
+    londiff_diviers = p.segment(x0="x0", y0="y0", x1="x1", y1="y1", line_width=3, line_color='l_col',
+                                source=divider_data_source)
+    longdiff_label = p.text(x="x0", y="text_y", text="text", source=bar_data_source)
 
     # TOOLTIPS FOR CITY DATA
-    tooltips_city = [
-        ('Country', '@country_ISO_A2'),
-        ('City', '@NAME'),
-        ('Relative position (dist) to timezone border', '@longitudinal_diff_km')
+    tooltips_longquads = [
+        ('Country', '@country'),
+        ('Avg. sunrise', '@avg_sunrise'),
+        ('Time difference from sunrise to 9:00', '@time_diff'),
+        ('Population percent of EU', '@pop_percent'),
+        ('Relative distance (km) to timezone border', '@long_diff'),
+        ('Weighted (population size) diff. to east timezone border', '@weighted_long_diff'),
+        ('Normalized, weighted (population size) effect of distance to east meridian', '@long_diff_norm')
     ]
-    p.add_tools(HoverTool(renderers=[city_longdiff_circles], tooltips=tooltips_city, name='test'))
+    p.add_tools(HoverTool(renderers=[longdiff_label], tooltips=tooltips_longquads, name='long_quads'))
     return p
 
 
-def bokeh_city_table(city_data):
-    source = ColumnDataSource(city_data)
+def get_country_table_source_data(country_data) -> dict:
+    country_data_sorted = country_data.sort_values('norm_weighted_mean_longdiff', ascending=False)
+    return ColumnDataSource.from_df(country_data_sorted)
+
+
+def bokeh_country_table(table_data):
+    source = ColumnDataSource(dict(table_data))
     columns = [
-        TableColumn(field="NAME", title="City Name"),
+        TableColumn(field='name', title='Country Name'),
+        TableColumn(field="iso_a2", title="Country Code (ISO_A2)"),
         TableColumn(field="social_timezone", title="Social Timezone"),
-        TableColumn(field="longitudinal_diff_km", title="Distance to east meridian (km)"),
-        TableColumn(field="country_ISO_A2", title="Country Code (ISO_A2)")
+        TableColumn(field="pop_est", title="Estimated population"),
+        TableColumn(field="pop_percent", title="% of EU population"),
+        TableColumn(field="dst", title="DST active"),
+        TableColumn(field="summer_period", title="Avg. sunrise in summer period"),
+        TableColumn(field="winter_period", title="Avg. sunrise in winter period"),
+        TableColumn(field="winter_diff_h", title="Difference between sunrise to 9:00 in winter"),
+        TableColumn(field="summer_diff_h", title="Difference between sunrise to 9:00 in summer"),
+        TableColumn(field="norm_weighted_mean_longdiff", title="Normalized weighted effect of dist. to east meridian"),
+        TableColumn(field="mean_longitudinal_diff_km", title="Avg. dist. to east meridian (km)"),
     ]
     data_table = DataTable(source=source, columns=columns)
     return data_table
 
 
-def bokeh_sun_table(sun_data):
-    source = ColumnDataSource(sun_data)
-
-    # Add data table
-    columns = [
-        TableColumn(field="iso_a3", title="Country Code (ISO_A3)"),
-        TableColumn(field="year", title="Year"),
-        TableColumn(field="month", title="Month"),
-        TableColumn(field="day", title="Day"),
-        TableColumn(field="sunrise_UTC", title="Sunrise (UTC/GMT)"),
-        TableColumn(field="sunset_UTC", title="Sunrise (UTC/GMT)")
-    ]
-    data_table = DataTable(source=source, columns=columns)
-    return data_table
+def get_daily_source_data(daily: dict, iso_a2: str, x_start: float, x_end: float, max_points: int) -> dict:
+    """
+    :param daily: Per day data of all countries as returned by get_daily_data.
+    :param iso_a2: Country to show.
+    :param x_start: Start of the visible x range (milliseconds since epoch).
+    :param x_end: End of the visible x range.
+    :param max_points: Max. number of points sent to the browser, see decimate_minmax.
+    :return: Returns the data of the daily chart source.
+    """
+    row = int(np.searchsorted(daily['countries'], iso_a2))
+    columns = {key: values[row] for key, values in daily.items() if key not in ('x', 'countries')}
+    return decimate_minmax(daily['x'], columns, x_start, x_end, max_points)
+
+
+def decimate_minmax(x: np.ndarray, columns: dict[str, np.ndarray], x_start: float, x_end: float,
+                    max_points: int) -> dict[str, np.ndarray]:
+    """
+    Reduces the points of a line chart within [x_start, x_end] to at most max_points (plus one point on either
+    side, so lines continue to the plot edges). The visible points are split into max_points / 2 buckets of
+    consecutive points, each bucket is replaced by the min. and max. of each column (in the order they occur)
+    at the first and last x of the bucket. With one bucket per pixel the lines look the same as with all points.
+    :param x: Sorted array of x values.
+    :param columns: Dict mapping column names to arrays of y values, same length as x.
+    :param x_start: Start of the visible x range.
+    :param x_end: End of the visible x range.
+    :param max_points: Max. number of points returned, usually twice the plot width in pixels.
+    :return: Returns a dict with the key 'x' and all keys of columns mapping to the reduced arrays.
+    """
+    start = max(int(np.searchsorted(x, x_start, side='left')) - 1, 0)
+    stop = min(int(np.searchsorted(x, x_end, side='right')) + 1, len(x))
+    if stop - start <= max_points:
+        return {'x': x[start:stop], **{name: y[start:stop] for name, y in columns.items()}}
+
+    bucket_size = -(-(stop - start) // max(max_points // 2, 1))
+    n_buckets = -(-(stop - start) // bucket_size)
+    # Indices of the points of each bucket, the last bucket is padded by repeating its last point
+    idx = np.minimum(start + np.arange(n_buckets * bucket_size).reshape(n_buckets, bucket_size), stop - 1)
+    buckets = np.arange(n_buckets)
+    reduced = {'x': np.column_stack([x[idx[:, 0]], x[idx[:, -1]]]).ravel()}
+    for name, y in columns.items():
+        values = y[idx]
+        nan = np.isnan(values)
+        arg_min = np.argmin(np.where(nan, np.inf, values), axis=1)
+        arg_max = np.argmax(np.where(nan, -np.inf, values), axis=1)
+        low, high = values[buckets, arg_min], values[buckets, arg_max]
+        max_first = arg_max < arg_min
+        reduced[name] = np.column_stack([np.where(max_first, high, low), np.where(max_first, low, high)]).ravel()
+    return reduced
+
+
+def bokeh_plot_daily(daily_source, x_range):
+    p = figure(toolbar_location='right', tools='xwheel_zoom, xpan, reset, save', active_scroll='xwheel_zoom',
+               title='Daily sunrise, sunset (local time) and daylight (hours)', x_axis_type='datetime',
+               x_range=x_range, y_range=(0, 24), width=daily_plot_width, height=500)
+    p.title.text_font_size = '20px'
+    p.yaxis.axis_label = 'Hours'
+    for series, color in daily_series_colors.items():
+        # Band from the earliest/shortest to the latest/longest city, line for the population weighted mean
+        p.varea(x='x', y1=f'{series}_min', y2=f'{series}_max', source=daily_source, fill_color=color,
+                fill_alpha=0.25)
+        p.line(x='x', y=f'{series}_mean', source=daily_source, line_color=color, line_width=2,
+               legend_label=series.capitalize())
+    p.legend.location = 'top_left'
+    p.add_tools(HoverTool(tooltips=[('Date', '@x{%F}'), ('Sunrise', '@sunrise_mean{0.00} h'),
+                                    ('Sunset', '@sunset_mean{0.00} h'), ('Daylight', '@daylight_mean{0.00} h')],
+                          formatters={'@x': 'datetime'}, mode='vline'))
+    return p
 
 
-def map_visualization():
+def _plot_width(fig) -> int:
+    # The browser reports the width of the plot area once it is rendered
+    try:
+        return fig.inner_width or daily_plot_width
+    except UnsetValueError:
+        return daily_plot_width
+
+
+def update_changed_columns(source, data: dict):
+    """
+    Updates only the columns of source that differ from data, so a single ColumnDataChanged event
+    with just these columns is sent to the browser.
+    :param source: ColumnDataSource to update in place.
+    :param data: New data for the source, must contain the same columns.
+    """
+    changed = {col: values for col, values in data.items() if not np.array_equal(source.data[col], values)}
+    if changed:
+        source.data.update(changed)
+
+
+def create_app():
+    """
+    Builds a new instance of the Panel app. Called once per session by panel serve (and once in the
+    Pyodide build), all data behind it is prepared on first use and shared between sessions, see cached_result.
+    :return: Returns the Panel layout of the app.
+    """
     # CREATE MAP  ----------------------------------------------------------------------------------
     # Create Map Panel
     map_pane = pn.pane.Bokeh(sizing_mode='scale_both', width_policy='max')
-    start_date = date(2022,1,1)
-    end_date = date(2022,12,31)
-    selected_date = pn.widgets.DateSlider(name='Date Slider', value=start_date, start=start_date, end=end_date)
+    dst_text = pn.widgets.StaticText(value='Daylight savings time (DST) enabled:')
+    dst_toggle = pn.widgets.Switch(name="DST Toggle")
+
+    period_text = pn.widgets.StaticText(
+        value='Summer Period (Last Sunday in March) / Winter Period (Last Sunday in October):')
+    period_toggle = pn.widgets.Switch(name="Summer/Winter period Toggle")
+
+    avg_text = pn.widgets.StaticText()
+
+    # The figure and its sources are created once, toggles only send the columns that differ between variants
+    initial_variant = get_toggle_variant(False, False)
+    bar_data_source = ColumnDataSource(dict(initial_variant['bars']))
+    divider_data_source = ColumnDataSource(dict(initial_variant['dividers']))
+    patch_source = get_bokeh_patch_source()
+    map_fig = bokeh_plot_map(patch_source, bar_data_source, divider_data_source)
+    map_pane.object = map_fig
+    lod = {'tier': lod_start_tier}
+
+    def update_lod(event):
+        tier = get_lod_tier(event.x1 - event.x0)
+        if tier != lod['tier']:
+            lod['tier'] = tier
+            patch_data = get_patch_data(tier)
+            patch_source.data.update(xs=patch_data['xs'], ys=patch_data['ys'])
+
+    map_fig.on_event(RangesUpdate, update_lod)
+
     def update_map(event):
-        d = selected_date.value
-        selected_sundata = sun_data_gpd.query(f'day == {d.day} & month == {d.month} & year == {d.year}')
-        map_pane.object = bokeh_plot_map(selected_sundata)
-    selected_date.param.watch(update_map, 'value')
-    selected_date.param.trigger('value')
+        variant = get_toggle_variant(dst_toggle.value, period_toggle.value)
+        update_changed_columns(bar_data_source, variant['bars'])
+        update_changed_columns(divider_data_source, variant['dividers'])
+
+        h, m = divmod(variant['weighted_avg'] * 60, 60)
+        avg_text.value = f'Population weighted avg. time difference from sunrise to 9:00: {int(h)}h:{int(m)}m'
+
+    dst_toggle.param.watch(update_map, 'value')
+    dst_toggle.param.trigger('value')
+
+    period_toggle.param.watch(update_map, 'value')
+    period_toggle.param.trigger('value')
 
     # CREATE DATATABLES ----------------------------------------------------------------------------------
     sizing_dict = dict(sizing_mode='stretch_both', width_policy='auto', margin=10)
     # Create City Table Panel
-    city_data_pane = pn.pane.Bokeh(**sizing_dict)
-    city_data_pane.object = bokeh_city_table(top_city_data)
+    country_data_pane = pn.pane.Bokeh(**sizing_dict)
+    country_data_pane.object = bokeh_country_table(get_country_table_data())
 
-    # Create Sun Table Panel
-    sun_data_pane = pn.pane.Bokeh(**sizing_dict)
-    sun_data_pane.object = bokeh_sun_table(sun_data_gpd.iloc[:,:-1])
+    # Create Daily Chart Panel
+    daily_pane = create_daily_tab()
 
     # Create panel application layout
-    map_vis = pn.Column(selected_date, map_pane)
-    tabs = pn.Tabs(('Map', map_vis), ('City Data', city_data_pane), ('Sun Data', sun_data_pane))
+    map_vis = pn.Column(pn.Row(pn.Column(pn.Row(dst_text, dst_toggle), pn.Row(period_text, period_toggle)), avg_text),
+                        map_pane)
+    tabs = pn.Tabs(('Map', map_vis), ('Daily', daily_pane), ('Country Data', country_data_pane))
     return tabs
 
 
-app = map_visualization()
-app.servable()
+def create_daily_tab():
+    """
+    Builds the daily chart of one country. The per day data of all years is prepared once per process,
+    a session only sends the points of the visible x range, decimated to the plot width (see
+    decimate_minmax), whenever the range or a widget changes.
+    :return: Returns the Panel layout of the tab.
+    """
+    country_names = get_country_data().drop_duplicates('iso_a2').set_index('iso_a2')['name']
+    countries = {country_names.get(iso_a2, iso_a2): iso_a2 for iso_a2 in get_daily_data(False)['countries']}
+    country_select = pn.widgets.Select(name='Country', options=dict(sorted(countries.items())))
+    dst_toggle = pn.widgets.Switch(name='DST Toggle')
+    x = get_daily_data(False)['x']
+    years_slider = pn.widgets.IntSlider(name='Years', start=1, end=max(len(x) // 365, 1), value=1)
+
+    x_range = Range1d(start=x[0], end=x[365 - 1], bounds=(x[0], x[-1]))
+    daily_source = ColumnDataSource()
+    daily_fig = bokeh_plot_daily(daily_source, x_range)
+
+    def update_daily(x_start, x_end):
+        max_points = daily_points_per_pixel * _plot_width(daily_fig)
+        daily_source.data = get_daily_source_data(get_daily_data(dst_toggle.value), country_select.value,
+                                                  x_start, x_end, max_points)
+
+    def update_years(event):
+        x_range.update(start=x[0], end=x[min(365 * years_slider.value, len(x)) - 1])
+        update_daily(x_range.start, x_range.end)
+
+    daily_fig.on_event(RangesUpdate, lambda event: update_daily(event.x0, event.x1))
+    country_select.param.watch(lambda event: update_daily(x_range.start, x_range.end), 'value')
+    dst_toggle.param.watch(lambda event: update_daily(x_range.start, x_range.end), 'value')
+    years_slider.param.watch(update_years, 'value')
+    update_daily(x_range.start, x_range.end)
+
+    dst_text = pn.widgets.StaticText(value='Daylight savings time (DST) enabled:')
+    return pn.Column(pn.Row(country_select, years_slider, pn.Row(dst_text, dst_toggle)),
+                     pn.pane.Bokeh(daily_fig, sizing_mode='stretch_width'))
+
+
+# SERVE APP, only when run by panel serve or in the Pyodide build, importing this module builds nothing
+if __name__ == '__main__' or pn.state.served:
+    create_app().servable()
 
 
 await write_doc()
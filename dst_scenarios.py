@@ -0,0 +1,143 @@
+import datetime
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import solar_position
+
+# DST rules of a policy
+EU_RULE = 'eu'  # Last Sunday of March until last Sunday of October
+NO_DST = 'never'  # Permanent standard time
+ALWAYS_DST = 'always'  # Permanent summer time
+CUSTOM_RULE = 'custom'  # Fixed (month, day) switch dates given in DstPolicy.switch_dates
+
+DARK_MORNING_MIN = 8 * 60  # Sunrise after 08:00
+EARLY_SUNSET_MIN = 17 * 60  # Sunset before 17:00
+REFERENCE_TIME_MIN = 9 * 60  # Same 9:00 reference as sun_data._add_differences_to_9_o_clock
+
+
+class DstPolicy(NamedTuple):
+    name: str
+    dst_rule: str = EU_RULE
+    switch_dates: tuple = None  # ((month, day), (month, day)) for CUSTOM_RULE, DST is active from start to end
+    zone_shift_h: dict = None  # Change of the standard time UTC offset per ISO_A2 country, e.g. {'ES': -1}
+    countries: list = None  # Countries the DST rule applies to, all others keep EU_RULE. None means all countries
+
+
+CURRENT_EU = DstPolicy('EU rules')
+PERMANENT_ST = DstPolicy('Permanent standard time', dst_rule=NO_DST)
+PERMANENT_DST = DstPolicy('Permanent summer time', dst_rule=ALWAYS_DST)
+
+
+def last_sunday_of_month(year: int, month: int) -> datetime.date:
+    """
+    :param year: Year of the date.
+    :param month: Month of the date (1-12).
+    :return: Returns the date of the last Sunday of the given month, e.g. the EU DST switch days in March and October.
+    """
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last_day = next_month - datetime.timedelta(days=1)
+    return last_day - datetime.timedelta(days=(last_day.weekday() - 6) % 7)
+
+
+def dst_active(dates: pd.DatetimeIndex, dst_rule: str = EU_RULE, switch_dates: tuple = None) -> np.ndarray:
+    """
+    Evaluates a DST rule for each day. The EU switches at 01:00 UTC, i.e. before sunrise everywhere in the EU,
+    so a switch day already counts as a day of the new setting.
+    :param dates: Days to evaluate.
+    :param dst_rule: One of EU_RULE, NO_DST, ALWAYS_DST or CUSTOM_RULE.
+    :param switch_dates: ((month, day), (month, day)) start and end of DST each year, only used for CUSTOM_RULE.
+    :return: Returns a bool array, True where DST is active.
+    :raises ValueError: If the rule is unknown or the CUSTOM_RULE switch dates are missing or do not start
+    before they end.
+    """
+    if dst_rule == CUSTOM_RULE:
+        _check_switch_dates(switch_dates)
+    if dst_rule == NO_DST:
+        return np.zeros(len(dates), dtype=bool)
+    if dst_rule == ALWAYS_DST:
+        return np.ones(len(dates), dtype=bool)
+
+    years = dates.year.to_numpy()
+    starts, ends = {}, {}
+    for year in np.unique(years):
+        if dst_rule == EU_RULE:
+            starts[year], ends[year] = last_sunday_of_month(year, 3), last_sunday_of_month(year, 10)
+        elif dst_rule == CUSTOM_RULE:
+            (start_month, start_day), (end_month, end_day) = switch_dates
+            starts[year] = datetime.date(year, start_month, start_day)
+            ends[year] = datetime.date(year, end_month, end_day)
+        else:
+            raise ValueError(f"Unknown DST rule '{dst_rule}'")
+    day_values = dates.values.astype('datetime64[D]')
+    start = np.array([starts[y] for y in years], dtype='datetime64[D]')
+    end = np.array([ends[y] for y in years], dtype='datetime64[D]')
+    return (day_values >= start) & (day_values < end)
+
+
+def evaluate_policies(city_data: pd.DataFrame, policies: list[DstPolicy], years) -> pd.DataFrame:
+    """
+    Evaluates many DST/timezone policies over a range of years in one batch. Sunrise and sunset in UTC are
+    calculated once for all cities and days, each policy then only shifts them by its local UTC offsets.
+    :param city_data: Dataframe of cities as returned by geo_utils.get_eu_city_data (latitude, longitude,
+    country_ISO_A2 and utc_sun_timezone_offset are used).
+    :param policies: List of DstPolicy to compare.
+    :param years: Iterable of years to evaluate, e.g. range(2020, 2030).
+    :return: Returns a dataframe with one row per policy and country containing the mean local sunrise and sunset
+    (minutes since local midnight), the mean difference of sunrise to 9:00 in hours and the average number of
+    days per year with a sunrise after 08:00 (dark_mornings) and a sunset before 17:00 (early_sunsets).
+    """
+    for policy in policies:  # Fail before the solar positions are calculated
+        if policy.dst_rule == CUSTOM_RULE:
+            _check_switch_dates(policy.switch_dates)
+    years = sorted(years)
+    dates = pd.date_range(start=f'{years[0]}-01-01', end=f'{years[-1]}-12-31')
+    dates = dates[np.isin(dates.year, years)]
+    events = solar_position.solar_events(city_data['latitude'], city_data['longitude'], dates)
+    sunrise_utc, sunset_utc = events['sunrise'], events['sunset']
+
+    countries = city_data['country_ISO_A2'].to_numpy()
+    base_offset = city_data['utc_sun_timezone_offset'].to_numpy(dtype='float64')
+    eu_dst = dst_active(dates)
+    results = []
+    for policy in policies:
+        offset_min = 60 * _policy_offsets(policy, countries, base_offset, dates, eu_dst)
+        sunrise, sunset = sunrise_utc + offset_min, sunset_utc + offset_min
+        city_results = pd.DataFrame({
+            'country_ISO_A2': countries,
+            'mean_sunrise_min': np.nanmean(sunrise, axis=1),
+            'mean_sunset_min': np.nanmean(sunset, axis=1),
+            'dark_mornings': (sunrise > DARK_MORNING_MIN).sum(axis=1) / len(years),
+            'early_sunsets': (sunset < EARLY_SUNSET_MIN).sum(axis=1) / len(years),
+        })
+        country_results = city_results.groupby('country_ISO_A2').mean().reset_index()
+        country_results.insert(0, 'policy', policy.name)
+        results.append(country_results)
+
+    results = pd.concat(results, ignore_index=True)
+    results['sunrise_diff_9_h'] = (REFERENCE_TIME_MIN - results['mean_sunrise_min']) / 60
+    return results
+
+
+def _check_switch_dates(switch_dates: tuple):
+    # DST periods spanning the new year (southern hemisphere style) are not supported, with start >= end
+    # DST would silently never be active
+    if switch_dates is None:
+        raise ValueError("CUSTOM_RULE needs switch_dates ((month, day), (month, day))")
+    start, end = (tuple(d) for d in switch_dates)
+    if start >= end:
+        raise ValueError(f"DST must start before it ends within a year, got switch_dates {switch_dates}")
+
+
+def _policy_offsets(policy: DstPolicy, countries: np.ndarray, base_offset: np.ndarray, dates: pd.DatetimeIndex,
+                    eu_dst: np.ndarray) -> np.ndarray:
+    # UTC offset in hours for each city (rows) and day (columns)
+    zone_shift_h = policy.zone_shift_h or {}
+    zone_shift = np.array([zone_shift_h.get(c, 0) for c in countries], dtype='float64')
+    policy_dst = eu_dst if policy.dst_rule == EU_RULE else dst_active(dates, policy.dst_rule, policy.switch_dates)
+    if policy.countries is None:
+        dst = policy_dst[np.newaxis, :]
+    else:
+        dst = np.where(np.isin(countries, policy.countries)[:, np.newaxis], policy_dst, eu_dst)
+    return (base_offset + zone_shift)[:, np.newaxis] + dst
@@ -0,0 +1,181 @@
+import heapq
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import tracing
+
+URBAN_AUDIT_TSV_PATH = 'datasets/Eurostat/urban_population/urb_cpop1_page_tabular_full.tsv'
+URBAN_AUDIT_CODES_PATH = 'datasets/Eurostat/urban_population/urb_esms_an4.xlsx'
+# Columnar copy of the XLSX code list, rewritten whenever the XLSX file changes (size or modification time)
+URBAN_AUDIT_CODES_CACHE_PATH = 'datasets/cache/urb_esms_an4.npz'
+
+POPULATION_INDICATOR = 'DE1001V'  # Population on the 1st of January, total
+STREAM_CHUNK_BYTES = 8 * 2 ** 20  # Approx. number of bytes of the TSV parsed at once by stream_top_n_population
+
+
+@tracing.traced
+def read_urban_audit_tsv(path: str = URBAN_AUDIT_TSV_PATH) -> pd.DataFrame:
+    """
+    Loads a Eurostat Urban Audit TSV export into a long, typed dataframe without any per-cell Python code.
+    Values such as "12345 b" are split into the number and its flag by the CSV parser itself,
+    missing values (":") become 0.
+    :param path: Path to the tab separated Eurostat export.
+    :return: Returns a dataframe with the columns indic_ur, CODE, country_ISO_A2 (categorical), year (int16),
+    value (int32) and flag (categorical, empty string if the value has no flag).
+    """
+    with open(path, encoding='utf-8') as f:
+        header, body = _split_fields(f.read()).split('\n', 1)
+    return _parse_urban_audit_body(body, header.split('\t'))
+
+
+@tracing.traced
+def stream_top_n_population(n: int, countries, codes=None, path: str = URBAN_AUDIT_TSV_PATH,
+                            indicator: str = POPULATION_INDICATOR,
+                            chunk_bytes: int = STREAM_CHUNK_BYTES) -> pd.DataFrame:
+    """
+    Same result as top_n_per_country(max_population_per_city(read_urban_audit_tsv(path), countries), n) for
+    exports of any size: the TSV is read in chunks of lines, lines of other indicators, spatial units that are
+    no city or outside the given countries are dropped before parsing, and only the n largest cities per country
+    are kept (in a heap per country), so memory does not grow with the size of the export.
+    Every city is expected in only one line per indicator, as in the Eurostat exports.
+    :param n: Number of cities to keep per country.
+    :param countries: Iterable of ISO_A2 country codes to keep.
+    :param codes: Optional iterable of city codes to keep (e.g. the codes with a name in the code list).
+    :param path: Path to the tab separated Eurostat export, may contain several indicators.
+    :param indicator: The indic_ur value of the population rows.
+    :param chunk_bytes: Approx. size of the chunks read at once.
+    :return: Returns a dataframe with the columns population, CODE and country_ISO_A2,
+    ordered by country and descending population.
+    """
+    countries = set(countries)
+    codes = None if codes is None else set(codes)
+    heaps = {}  # Country -> min heap of (population, -line number, CODE) holding its n largest cities
+    line_nr = 0
+    with open(path, encoding='utf-8') as f:
+        header_fields = _split_fields(f.readline().rstrip('\n')).split('\t')
+        while lines := f.readlines(chunk_bytes):
+            tracing.count('eurostat.lines_read', len(lines))
+            lines = [line for line in lines if _is_selected_line(line, indicator, countries, codes)]
+            tracing.count('eurostat.lines_selected', len(lines))
+            if not lines:
+                continue
+            chunk = max_population_per_city(_parse_urban_audit_body(_split_fields(''.join(lines)), header_fields),
+                                            countries)
+            for code, population in zip(chunk['CODE'], chunk['population'].tolist()):
+                heap = heaps.setdefault(code[:2], [])
+                entry = (population, -line_nr, code)  # Ties keep the city listed first, like top_n_per_country
+                line_nr += 1
+                if len(heap) < n:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+    rows = [(population, code, country) for country in sorted(heaps)
+            for population, _, code in sorted(heaps[country], reverse=True)]
+    return pd.DataFrame(rows, columns=['population', 'CODE', 'country_ISO_A2']).astype({'population': 'int32'})
+
+
+def _is_selected_line(line: str, indicator: str, countries: set, codes: set) -> bool:
+    # The key "freq,indic_ur,code" precedes the first tab, a city code ends with 'C' and starts with its country
+    if not line.strip():  # Blank lines, e.g. trailing newlines, are skipped like pd.read_csv does
+        return False
+    _, line_indicator, code = line[:line.find('\t')].split(',')
+    return line_indicator == indicator and code.endswith('C') and code[:2] in countries and \
+        (codes is None or code in codes)
+
+
+def _split_fields(text: str) -> str:
+    # Every cell is "<value> <flag>" and the key is "freq,indic_ur,code", turning both separators into tabs
+    # lets the C parser split everything into typed columns: key columns, then alternating value/flag columns.
+    return text.replace(',', '\t').replace(' ', '\t')
+
+
+def _parse_urban_audit_body(body: str, header_fields: list[str]) -> pd.DataFrame:
+    n_key_cols = 3
+    years = np.array(header_fields[n_key_cols::2], dtype='int16')
+    value_cols = list(range(n_key_cols, n_key_cols + 2 * len(years), 2))
+    flag_cols = [c + 1 for c in value_cols]
+    dtypes = {1: 'category', 2: 'category', **{c: 'float64' for c in value_cols}, **{c: 'category' for c in flag_cols}}
+    raw = pd.read_csv(io.StringIO(body), sep='\t', header=None, usecols=[1, 2] + value_cols + flag_cols,
+                      dtype=dtypes, na_values=[':'], keep_default_na=False)
+
+    n_rows = len(raw)
+    code = raw[2].cat
+    country = pd.Categorical(code.categories.str[:2])
+    return pd.DataFrame({
+        'indic_ur': pd.Categorical.from_codes(np.tile(raw[1].cat.codes, len(years)), raw[1].cat.categories),
+        'CODE': pd.Categorical.from_codes(np.tile(code.codes, len(years)), code.categories),
+        'country_ISO_A2': pd.Categorical.from_codes(np.tile(country.codes[code.codes], len(years)),
+                                                    country.categories),
+        'year': np.repeat(years, n_rows),
+        'value': np.nan_to_num(raw[value_cols].to_numpy().ravel(order='F')).astype('int32'),
+        'flag': union_categoricals([raw[c] for c in flag_cols]),
+    })
+
+
+@tracing.traced
+def read_urban_audit_codes(path: str = URBAN_AUDIT_CODES_PATH,
+                           cache_path: str = URBAN_AUDIT_CODES_CACHE_PATH) -> pd.DataFrame:
+    """
+    Loads the Urban Audit code list (spatial units and their names). Parsing the XLSX file is slow, so it is
+    converted once into a columnar .npz file at cache_path, which is used as long as the XLSX file is unchanged.
+    :param path: Path to the Eurostat metadata XLSX file.
+    :param cache_path: Path of the columnar copy, None to always read the XLSX file.
+    :return: Returns a dataframe with the columns CODE and NAME.
+    """
+    source_stat = np.array([os.stat(path).st_size, os.stat(path).st_mtime_ns], dtype='int64')
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if np.array_equal(cached['source_stat'], source_stat):
+                tracing.count('eurostat.codes_cache_hits')
+                return pd.DataFrame({col: cached[f'column_{i}'] for i, col in enumerate(cached['columns'])},
+                                    dtype=object)
+
+    tracing.count('eurostat.codes_cache_misses')
+    with tracing.span('eurostat.read_excel'):
+        city_codes = pd.read_excel(path, dtype=str)
+    city_codes['CODE'] = city_codes['CODE'].str.strip()
+    if cache_path and not city_codes.isna().any(axis=None):  # .npz string columns cannot hold missing values
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        # Written to a temporary file first, so an interrupted write never leaves a broken cache behind
+        tmp_path = f'{cache_path}.tmp.npz'
+        np.savez(tmp_path, source_stat=source_stat, columns=np.array(city_codes.columns, dtype=str),
+                 **{f'column_{i}': city_codes[col].to_numpy(dtype=str) for i, col in enumerate(city_codes.columns)})
+        os.replace(tmp_path, cache_path)
+    return city_codes
+
+
+@tracing.traced
+def max_population_per_city(urban_audit_df: pd.DataFrame, countries) -> pd.DataFrame:
+    """
+    Reduces a dataframe from read_urban_audit_tsv to the maximum population over all years
+    for each city (codes ending with 'C') of the given countries.
+    :param urban_audit_df: Dataframe returned by read_urban_audit_tsv.
+    :param countries: Iterable of ISO_A2 country codes to keep.
+    :return: Returns a dataframe with the columns population, CODE and country_ISO_A2.
+    """
+    is_city = urban_audit_df['CODE'].cat.categories.str.endswith('C')[urban_audit_df['CODE'].cat.codes]
+    mask = is_city & urban_audit_df['country_ISO_A2'].isin(countries).to_numpy()
+    cities = urban_audit_df.loc[mask, ['CODE', 'value']]
+    population = cities.groupby('CODE', observed=True, sort=False)['value'].max()
+    codes = population.index.astype(str)
+    return pd.DataFrame({'population': population.to_numpy(), 'CODE': codes, 'country_ISO_A2': codes.str[:2]})
+
+
+@tracing.traced
+def top_n_per_country(df: pd.DataFrame, n: int, column: str = 'population') -> pd.DataFrame:
+    """
+    Selects the n largest rows per country by sorting once and taking the head of each group,
+    ties are resolved in the original row order (like DataFrame.nlargest).
+    :param df: Dataframe with a country_ISO_A2 column.
+    :param n: Number of rows to keep per country.
+    :param column: Column to rank by.
+    :return: Returns the selected rows ordered by country and descending column value.
+    """
+    ranked = df.sort_values(column, ascending=False, kind='stable')
+    ranked = ranked.groupby('country_ISO_A2', observed=True, sort=False).head(n)
+    return ranked.sort_values('country_ISO_A2', kind='stable').reset_index(drop=True)
@@ -0,0 +1,35 @@
+import numpy as np
+import shapely
+from shapely.ops import linemerge, unary_union
+
+
+def simplify_shared_borders(geometries, tolerance: float) -> list:
+    """
+    Simplifies polygons so that borders shared by neighbouring polygons stay identical.
+    All rings are noded into arcs between border junctions, each arc is simplified once
+    (Douglas-Peucker with fixed end points) and the polygons are rebuilt from the simplified arcs,
+    so neighbours neither overlap nor leave gaps along their common border.
+    :param geometries: Iterable of (Multi)Polygons in a projected CRS (e.g. EPSG:3857).
+    :param tolerance: Simplification tolerance in CRS units (meters for EPSG:3857), 0 returns the input.
+    :return: Returns a list of simplified geometries in the same order, None where a polygon collapsed entirely.
+    """
+    geometries = np.asarray(list(geometries), dtype=object)
+    if tolerance <= 0:
+        return list(geometries)
+
+    # Node all rings once: shared borders become single arcs, split at junctions of three or more polygons
+    arcs = linemerge(unary_union(shapely.boundary(geometries)))
+    arcs = shapely.get_parts(arcs) if arcs.geom_type == 'MultiLineString' else np.array([arcs])
+    simplified = shapely.simplify(arcs, tolerance, preserve_topology=True)
+
+    # Re-node, as independently simplified arcs may touch, then rebuild faces and assign them to their polygon
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(unary_union(simplified))))
+    faces = faces[shapely.area(faces) > 0]
+    tree = shapely.STRtree(geometries)
+    face_idx, geom_idx = tree.query(shapely.point_on_surface(faces), predicate='within')
+
+    result = []
+    for i in range(len(geometries)):
+        own_faces = faces[face_idx[geom_idx == i]]
+        result.append(shapely.union_all(own_faces) if len(own_faces) else None)
+    return result
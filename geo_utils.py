@@ -1,36 +1,58 @@
-import geopandas as gpd
+import functools
+
+import numpy as np
 import pandas as pd
-from countryinfo import CountryInfo
-from sklearn.preprocessing import MinMaxScaler
-from unidecode import unidecode
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
-from datetime import datetime
-import math
-
-geolocator = Nominatim(user_agent='CircadianRythmEU')
-tf = TimezoneFinder()
-timezone_df = pd.read_csv('datasets/saved/timezones_eu.csv', index_col=0)
-country_whitelist = pd.read_csv('datasets/saved/eu_country_codes.csv')
-dt_now = datetime.now()
+
+import eurostat
+import geocoding
+import geometry
+import sun_data
+import timezones
+import tracing
+
+# Heavy dependencies (geopandas, sklearn, countryinfo, unidecode) and all datasets are only loaded on first use,
+# so importing this module stays cheap
+TIMEZONES_PATH = 'datasets/saved/timezones_eu.csv'
+COUNTRY_CODES_PATH = 'datasets/saved/eu_country_codes.csv'
 
 ADJUST_LOCAL_SUMMERTIME = True
-LONGITUDE_DEGREE_KM_RATIO = 80
 
 
-def load_eu_countries_as_geopandas() -> gpd.GeoDataFrame:
+@functools.lru_cache(maxsize=None)
+def get_timezone_df() -> pd.DataFrame:
+    """
+    :return: Returns the standard timezone abbreviation and GMT offset of each EU country, indexed by ISO_A2.
+    Loaded once, treat it as read-only.
+    """
+    return pd.read_csv(TIMEZONES_PATH, index_col=0)
+
+
+@functools.lru_cache(maxsize=None)
+def get_country_whitelist() -> pd.DataFrame:
+    """
+    :return: Returns the ISO_A2 codes (column iso_A2) of the countries included in the analysis.
+    Loaded once, treat it as read-only.
+    """
+    return pd.read_csv(COUNTRY_CODES_PATH)
+
+
+@tracing.traced
+def load_eu_countries_as_geopandas() -> 'gpd.GeoDataFrame':
     """
     Loads a geopandas dataframe using the 'naturalearth_lowres' dataset from GeoPandas
     for europe. This includes borders and other country data.
     :param ignored_countries: A list of countries in ISO_A3 to ignore.
     :return: Returns a GeoPandas dataframe of european countries.
     """
+    import geopandas as gpd
+    from countryinfo import CountryInfo
+
     world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
     c = CountryInfo()
     iso_conversion = {v['ISO']['alpha3']: v['ISO']['alpha2'] for _, v in c.all().items()}
     iso_conversion['GRC'] = 'EL' # Hacky solution but this fixes the iso conversion to EU norm
-    world['iso_a2'] = world.apply(lambda x: iso_conversion.get(x['iso_a3'], None), axis=1)
-    europe = world[world['iso_a2'].isin(country_whitelist['iso_A2'])]
+    world['iso_a2'] = world['iso_a3'].map(iso_conversion)
+    europe = world[world['iso_a2'].isin(get_country_whitelist()['iso_A2'])]
     europe = europe.to_crs(3857)
     return europe
 
@@ -40,6 +62,9 @@ def get_eu_capitals() -> dict[str, str]:
     Generates mappings from ISO_A3 country codes to the countries capital city name in normalized fashion.
     :return: Returns a dict mapping from ISO_A3 (key) to capital city name (value).
     """
+    from countryinfo import CountryInfo
+    from unidecode import unidecode
+
     europe = load_eu_countries_as_geopandas()
     country = CountryInfo()
     iso_to_cap = {v['ISO']['alpha3']: v['capital'] for k, v in country.all().items() if 'capital' in v.keys()}
@@ -48,6 +73,7 @@ def get_eu_capitals() -> dict[str, str]:
     return iso_to_cap_EU_norm
 
 
+@tracing.traced
 def get_eu_city_data(top_n_pop: int = 3) -> pd.DataFrame:
     """
     Loads the top n cities for each EU country using the Urban Audit dataset.
@@ -60,6 +86,7 @@ def get_eu_city_data(top_n_pop: int = 3) -> pd.DataFrame:
     return _add_timezone_features_to_cities(top_n_cities_per_country)
 
 
+@tracing.traced
 def get_avg_country_data(city_data: pd.DataFrame, eu_data: pd.DataFrame) -> pd.DataFrame:
     """
     Get average circadian (and other statistical measures) statistics from the top n cities
@@ -68,6 +95,8 @@ def get_avg_country_data(city_data: pd.DataFrame, eu_data: pd.DataFrame) -> pd.D
     :param eu_data: Dataframe of data related to european countries (stats, geo, etc.), Has to have iso_a2 field.
     :return: Return an dataframe with averages measures of the given cities for each country.
     """
+    from sklearn.preprocessing import MinMaxScaler
+
     standard_wintertime_df = _create_averaged_country_df_for_column('longitudinal_diff_km', city_data, eu_data)
     standard_wintertime_df['dst'] = False
     summertime_df = _create_averaged_country_df_for_column('summertime_longitudinal_diff_km', city_data, eu_data)
@@ -84,11 +113,15 @@ def get_avg_country_data(city_data: pd.DataFrame, eu_data: pd.DataFrame) -> pd.D
     return country_data
 
 
+@tracing.traced
 def _create_averaged_country_df_for_column(col_label: str, city_data: pd.DataFrame,
                                            eu_data: pd.DataFrame) -> pd.DataFrame:
-    cmeans = city_data.groupby('country_ISO_A2')[col_label].mean()
-    country_data = city_data.groupby('country_ISO_A2').first().reset_index()
-    country_data['mean_longitudinal_diff_km'] = country_data.apply(lambda x: cmeans[x['country_ISO_A2']], axis=1)
+    from sklearn.preprocessing import MinMaxScaler
+
+    by_country = city_data.groupby('country_ISO_A2')
+    country_data = by_country.first()
+    country_data['mean_longitudinal_diff_km'] = by_country[col_label].mean()
+    country_data = country_data.reset_index()
     country_data = country_data[
         ['social_timezone', 'utc_sun_timezone_offset', 'mean_longitudinal_diff_km', 'country_ISO_A2', 'mercantor_x',
          'mercantor_y']]
@@ -102,93 +135,57 @@ def _create_averaged_country_df_for_column(col_label: str, city_data: pd.DataFra
     return country_data
 
 
+@tracing.traced
 def _get_top_n_pop_cities_per_country(top_n_pop: int) -> pd.DataFrame:
-    # Load data from Urban Audit dataset
-    eu_cities_pop_full = pd.read_csv('datasets/Eurostat/urban_population/urb_cpop1_page_tabular_full.tsv',
-                                     sep='\t', header=0)
-    eu_cities_pop_full = eu_cities_pop_full.replace(r'^(\D+)$', 0, regex=True)
-    city_codes = pd.read_excel('datasets/Eurostat/urban_population/urb_esms_an4.xlsx', dtype=str)
-    city_codes['CODE'] = city_codes['CODE'].apply(lambda x: x.strip())
-
-    # Extract city name, country codes by merging with metadata
-    eu_cities_pop = pd.DataFrame()
-    eu_cities_pop['code_info'] = eu_cities_pop_full.iloc[:, 0]
-    eu_cities_pop['population'] = eu_cities_pop_full.iloc[:, 1:].applymap(
-        lambda x: int(x.split(' ')[0]) if type(x) != int else x).astype('int32').max(axis=1)
-    eu_cities_pop['CODE'] = eu_cities_pop.iloc[:, 0].apply(lambda x: x.split(',')[-1])
-    eu_cities_pop = eu_cities_pop[eu_cities_pop['CODE'].apply(lambda x: x[-1] == 'C')]  # Filter out cities only !
-    eu_cities_pop['country_ISO_A2'] = eu_cities_pop['CODE'].apply(lambda x: x[0:2])
-    eu_cities_pop = eu_cities_pop[eu_cities_pop['country_ISO_A2'].isin(country_whitelist['iso_A2'])]
-    eu_cities = eu_cities_pop.merge(city_codes, on='CODE')
-    eu_cities = eu_cities.iloc[:, 1:]
-
-    # Get top n cities population wise per country
-    top_n_cities_per_country = eu_cities.groupby('country_ISO_A2').apply(
-        lambda x: x.nlargest(top_n_pop, 'population')).reset_index(drop=True)
-    return top_n_cities_per_country
-
-
-def _add_timezone_features_to_cities(top_cities_df: pd.DataFrame) -> pd.DataFrame:
+    # Stream the Urban Audit dataset, keeping the top n cities (highest population over all years) per country
+    # among the cities with a name in the metadata
+    city_codes = eurostat.read_urban_audit_codes()
+    eu_cities_pop = eurostat.stream_top_n_population(top_n_pop, get_country_whitelist()['iso_A2'],
+                                                     codes=city_codes['CODE'])
+
+    # Extract city name by merging with metadata
+    return eu_cities_pop.merge(city_codes, on='CODE')
+
+
+@tracing.traced
+def _add_timezone_features_to_cities(top_cities_df: pd.DataFrame, geocode_backends: list = None,
+                                     geocode_cache: geocoding.GeocodeCache = None) -> pd.DataFrame:
     # Get longitude and latitude, remove NaNs, concat to top cities df on column axis
-    geo_city_df = top_cities_df.apply(lambda x: _get_geo_location(x), axis='columns', result_type='expand')
-    geo_city_df.columns = ['longitude', 'latitude', 'mercantor_x', 'mercantor_y']
+    tracing.count('geo_utils.cities', len(top_cities_df))
+    geo_city_df = _get_geo_locations(top_cities_df, geocode_backends, geocode_cache)
     top_cities_geo = pd.concat([top_cities_df, geo_city_df], axis=1)
     top_cities_geo = top_cities_geo.dropna()
     return pd.concat([top_cities_geo, _get_timezone_data(top_cities_geo)], axis=1)
 
 
-def _get_geo_location(x):
-    city_name = f"{x['NAME']}, {x['country_ISO_A2']}"
-    try:
-        geo_info = geolocator.geocode(city_name)
-        lat = geo_info.latitude
-        lon = geo_info.longitude
-        merc_x, merc_y = _mercantor_from_coords(lat, lon)
-        return lon, lat, merc_x, merc_y
-    except AttributeError:
-        return None, None, None, None
-
-
-def _mercantor_from_coords(lat, lon):
-    r_major = 6378137.000
-    x = r_major * math.radians(lon)
-    scale = x / lon
-    y = 180 / math.pi * math.log(math.tan(math.pi / 4 + lat * (math.pi / 180) / 2)) * scale
-    return x, y
-
-
-def _add_tz_info(x):
-    long = x['longitude']
-
-    tz_info = timezone_df.loc[x['country_ISO_A2']]
-    utc_offset = tz_info['gmt_offset']
-    tz_name = tz_info['timezone']
-
-    # Get longitudinal meridian values for each timezone --> 15 degrees per tz (360 deg / 24 hours)
-    # We then calculate the distance to it similar to [Trang Vophan et. al 2018]
-    standard_winter_time_londiff_km = _get_longdiff_km_for_utc_offset(long, utc_offset)
-    summertime_longdiff_km = _get_longdiff_km_for_utc_offset(long, utc_offset + 1)
-
-    return tz_name, utc_offset, summertime_longdiff_km, standard_winter_time_londiff_km
-
-
-def _get_longdiff_km_for_utc_offset(long, utc_offset: int):
-    meridian_east = 15 * utc_offset
-    long_diff = meridian_east - long
-    long_diff_km = LONGITUDE_DEGREE_KM_RATIO * long_diff
-    return long_diff_km
+@tracing.traced
+def _get_geo_locations(cities_df: pd.DataFrame, geocode_backends: list = None,
+                       geocode_cache: geocoding.GeocodeCache = None) -> pd.DataFrame:
+    # Cached batch lookup, see geocoding.geocode_cities for the backend order
+    lat, lon = geocoding.geocode_cities(cities_df['NAME'], cities_df['country_ISO_A2'], backends=geocode_backends,
+                                        cache=geocode_cache)
+    mercantor_x, mercantor_y = geometry.web_mercator(lon, lat)
+    return pd.DataFrame({'longitude': lon, 'latitude': lat, 'mercantor_x': mercantor_x, 'mercantor_y': mercantor_y},
+                        index=cities_df.index, dtype='float64')
 
 
+@tracing.traced
 def _get_timezone_data(top_city_data: pd.DataFrame) -> pd.DataFrame:
-    # Load timezones and offsets
-    tz_geo_info = top_city_data.apply(lambda x: _add_tz_info(x), axis='columns', result_type='expand')
-    tz_geo_info.columns = ['social_timezone', 'utc_sun_timezone_offset', 'summertime_longitudinal_diff_km',
-                           'longitudinal_diff_km']
-    return tz_geo_info
-
-
-if __name__ == "__main__":
-    #test_cities = get_eu_city_data(3)
-    eu_data = load_eu_countries_as_geopandas()
-    #country_data = get_avg_country_data(test_cities, eu_data)
-    pass
+    # Timezone of each city by its location (see timezones.py), the country table is only a fallback
+    # for cities outside all timezone polygons (e.g. geocoded slightly off the coast)
+    longitude = top_city_data['longitude'].to_numpy(dtype='float64')
+    latitude = top_city_data['latitude'].to_numpy(dtype='float64')
+    resolver = timezones.get_resolver()
+    iana_timezone = resolver.zones(longitude, latitude)
+    utc_offset = resolver.standard_offsets(longitude, latitude, sun_data.YEAR)
+    country_offset = get_timezone_df()['gmt_offset'].reindex(top_city_data['country_ISO_A2']).to_numpy()
+    utc_offset = np.where(np.isnan(utc_offset), country_offset, utc_offset).astype('int64')  # Whole hours in the EU
+
+    # Distance to the central meridian of each timezone (15 degrees per hour) similar to [Trang Vophan et. al 2018]
+    return pd.DataFrame({
+        'social_timezone': timezones.standard_abbreviations(utc_offset),
+        'utc_sun_timezone_offset': utc_offset,
+        'summertime_longitudinal_diff_km': geometry.meridian_distance_km(longitude, latitude, utc_offset + 1),
+        'longitudinal_diff_km': geometry.meridian_distance_km(longitude, latitude, utc_offset),
+        'iana_timezone': iana_timezone,
+    }, index=top_city_data.index)
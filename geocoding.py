@@ -0,0 +1,174 @@
+import sqlite3
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+GEOCODE_CACHE_PATH = 'datasets/cache/geocode_cache.sqlite'
+GAZETTEER_PATH = 'datasets/saved/gazetteer.csv'
+NOMINATIM_USER_AGENT = 'CircadianRythmEU'
+NOMINATIM_MIN_DELAY_SECONDS = 1.0  # Nominatim usage policy allows at most one request per second
+NOMINATIM_BATCH_SIZE = 25  # Misses are written to the cache after each batch, so progress survives interrupts
+NOMINATIM_MAX_ERRORS = 3  # Consecutive failed requests (network, timeout, HTTP 429, ...) after which it gives up
+
+
+class GeocodeMissWarning(UserWarning):
+    """
+    Issued by geocode_cities for cities no backend could answer (e.g. without network). They are not cached and
+    build_data.py does not record the stage as built, so they are looked up again on the next run.
+    """
+
+
+def normalize_query(name: str, country_iso_a2: str) -> str:
+    """
+    Builds the normalized "NAME, ISO_A2" key used for the geocode cache and all backends.
+    :param name: City name as found in the Urban Audit metadata.
+    :param country_iso_a2: ISO_A2 country code (EU norm, e.g. EL for Greece).
+    :return: Returns the query with collapsed whitespace in lower case.
+    """
+    return ' '.join(f"{name}, {country_iso_a2}".split()).casefold()
+
+
+class GeocodeCache:
+    """
+    Persistent SQLite cache mapping normalized queries to (latitude, longitude).
+    Queries a backend answered with "no result" are stored with NULL coordinates, so they are not looked up again.
+    Queries that failed (e.g. without network) are never stored and are looked up again on the next run.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH):
+        self.path = path
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS geocode '
+                                 '(query TEXT PRIMARY KEY, latitude REAL, longitude REAL, source TEXT)')
+
+    def get_many(self, queries: list[str]) -> dict[str, tuple]:
+        found = {}
+        for i in range(0, len(queries), 500):  # Stay below SQLite's host parameter limit
+            chunk = queries[i:i + 500]
+            rows = self._connection.execute(
+                f"SELECT query, latitude, longitude FROM geocode WHERE query IN ({','.join('?' * len(chunk))})",
+                chunk)
+            found.update({q: (lat, lon) for q, lat, lon in rows})
+        return found
+
+    def put_many(self, results: dict[str, tuple], source: str):
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)',
+                                         [(q, lat, lon, source) for q, (lat, lon) in results.items()])
+
+    def close(self):
+        self._connection.close()
+
+
+class GazetteerBackend:
+    """
+    Offline backend resolving queries from a bundled CSV gazetteer with NAME, country_ISO_A2,
+    latitude and longitude columns.
+    """
+    name = 'gazetteer'
+    batch_size = None
+
+    def __init__(self, path: str = GAZETTEER_PATH):
+        gazetteer = pd.read_csv(path)
+        queries = [normalize_query(n, c) for n, c in zip(gazetteer['NAME'], gazetteer['country_ISO_A2'])]
+        self._coords = dict(zip(queries, zip(gazetteer['latitude'], gazetteer['longitude'])))
+
+    def geocode_many(self, queries: list[str]) -> dict[str, tuple]:
+        return {q: self._coords[q] for q in queries if q in self._coords}
+
+
+class NominatimBackend:
+    """
+    Online backend resolving queries with the OpenStreetMap Nominatim service.
+    All queries are sent in rate-limited batches and unresolvable ones are returned as (None, None).
+    Failed requests are retried by the rate limiter and then left out of the result, so they stay misses.
+    After max_errors consecutive failures the service is considered unavailable and no further requests are sent.
+    """
+    name = 'nominatim'
+
+    def __init__(self, user_agent: str = NOMINATIM_USER_AGENT, min_delay_seconds: float = NOMINATIM_MIN_DELAY_SECONDS,
+                 batch_size: int = NOMINATIM_BATCH_SIZE, max_errors: int = NOMINATIM_MAX_ERRORS):
+        from geopy.extra.rate_limiter import RateLimiter
+        from geopy.geocoders import Nominatim
+        # Without swallow_exceptions=False, errors are returned as None and would be cached as "not found"
+        self._geocode = RateLimiter(Nominatim(user_agent=user_agent).geocode, min_delay_seconds=min_delay_seconds,
+                                    swallow_exceptions=False)
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self._consecutive_errors = 0
+
+    def geocode_many(self, queries: list[str]) -> dict[str, tuple]:
+        from geopy.exc import GeopyError
+
+        results = {}
+        for q in queries:
+            if self._consecutive_errors >= self.max_errors:
+                break
+            try:
+                location = self._geocode(q)
+            except GeopyError as e:
+                self._consecutive_errors += 1
+                print(f"Could not geocode {q!r} ({type(e).__name__}), it is looked up again on the next run")
+                continue
+            self._consecutive_errors = 0
+            results[q] = (location.latitude, location.longitude) if location is not None else (None, None)
+        return results
+
+
+def default_backends() -> list:
+    """
+    :return: Returns the gazetteer backend followed by the Nominatim backend.
+    """
+    return [GazetteerBackend(), NominatimBackend()]
+
+
+@tracing.traced
+def geocode_cities(names, country_codes, backends: list = None, cache: GeocodeCache = None) -> tuple:
+    """
+    Geocodes cities by looking them up in the persistent cache first and then passing the remaining
+    misses to each backend in order. Everything a backend resolves is written back to the cache.
+    If cities remain that no backend could answer, a GeocodeMissWarning is issued.
+    :param names: Iterable of city names.
+    :param country_codes: Iterable of ISO_A2 country codes, same length as names.
+    :param backends: List of backends with a geocode_many(queries) method, defaults to default_backends().
+    :param cache: GeocodeCache to use, defaults to the cache at GEOCODE_CACHE_PATH.
+    :return: Returns two float arrays (latitudes, longitudes), NaN where a city could not be resolved.
+    """
+    queries = [normalize_query(n, c) for n, c in zip(names, country_codes)]
+    unique_queries = list(dict.fromkeys(queries))
+    own_cache = cache is None
+    cache = GeocodeCache() if own_cache else cache
+    try:
+        coords = cache.get_many(unique_queries)
+        misses = [q for q in unique_queries if q not in coords]
+        tracing.count('geocoding.cache_hits', len(coords))
+        tracing.count('geocoding.cache_misses', len(misses))
+        if backends is None:
+            backends = default_backends() if misses else []
+        for backend in backends:
+            if not misses:
+                break
+            step = backend.batch_size or len(misses)
+            for i in range(0, len(misses), step):
+                with tracing.span(f'geocoding.{backend.name}', queries=len(misses[i:i + step])):
+                    resolved = backend.geocode_many(misses[i:i + step])
+                tracing.count(f'geocoding.{backend.name}_resolved', len(resolved))
+                cache.put_many(resolved, backend.name)
+                coords.update(resolved)
+            misses = [q for q in misses if q not in coords]
+    finally:
+        if own_cache:
+            cache.close()
+    if misses:
+        tracing.count('geocoding.unresolved', len(misses))
+        warnings.warn(f"{len(misses)} cities could not be geocoded (NaN), e.g. {misses[0]!r}", GeocodeMissWarning)
+
+    lat = np.array([coords.get(q, (None, None))[0] for q in queries], dtype='float64')
+    lon = np.array([coords.get(q, (None, None))[1] for q in queries], dtype='float64')
+    return lat, lon
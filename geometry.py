@@ -0,0 +1,45 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088  # Mean earth radius (IUGG)
+WEB_MERCATOR_RADIUS_M = 6378137.0  # Semi-major axis of WGS 84, as used by EPSG:3857
+# Web Mercator is cut off here, which makes the map square. Beyond it y grows to infinity at the poles
+WEB_MERCATOR_MAX_LATITUDE = 85.0511287798
+DEGREES_PER_UTC_HOUR = 15.0  # 360 degrees / 24 hours
+
+
+def timezone_meridians(utc_offsets) -> np.ndarray:
+    """
+    :param utc_offsets: Array-like of UTC offsets in hours.
+    :return: Returns the longitude of the central meridian of each timezone in degrees.
+    """
+    return DEGREES_PER_UTC_HOUR * np.asarray(utc_offsets, dtype='float64')
+
+
+def meridian_distance_km(longitudes, latitudes, utc_offsets) -> np.ndarray:
+    """
+    Great circle distance from each location to the central meridian of its timezone, i.e. the length of the
+    shortest path to the meridian on a spherical earth. A degree of longitude is ~111 km at the equator
+    but only ~56 km at 60 degrees north, so the same longitudinal offset means a smaller distance in the north.
+    :param longitudes: Array-like of longitudes in degrees, east positive.
+    :param latitudes: Array-like of latitudes in degrees, same shape as longitudes (or broadcastable).
+    :param utc_offsets: Array-like of UTC offsets in hours, same shape as longitudes (or broadcastable).
+    :return: Returns a float array of distances in km, positive if the meridian lies east of the location
+    (the sun rises later than the timezone suggests), negative if it lies west. NaN propagates.
+    """
+    lon_diff = np.radians(timezone_meridians(utc_offsets) - np.asarray(longitudes, dtype='float64'))
+    lat = np.radians(np.asarray(latitudes, dtype='float64'))
+    # Cross track distance to the meridian great circle, for small differences ~ radius * lon_diff * cos(lat)
+    return EARTH_RADIUS_KM * np.arcsin(np.sin(lon_diff) * np.cos(lat))
+
+
+def web_mercator(longitudes, latitudes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Projects WGS 84 coordinates to Web Mercator (EPSG:3857), the projection of the Bokeh tile maps.
+    :param longitudes: Array-like of longitudes in degrees, east positive.
+    :param latitudes: Array-like of latitudes in degrees, clipped to +-WEB_MERCATOR_MAX_LATITUDE.
+    :return: Returns float arrays x and y in meters. NaN propagates.
+    """
+    lon = np.radians(np.asarray(longitudes, dtype='float64'))
+    lat = np.radians(np.clip(np.asarray(latitudes, dtype='float64'),
+                             -WEB_MERCATOR_MAX_LATITUDE, WEB_MERCATOR_MAX_LATITUDE))
+    return WEB_MERCATOR_RADIUS_M * lon, WEB_MERCATOR_RADIUS_M * np.log(np.tan(np.pi / 4 + lat / 2))
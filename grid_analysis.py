@@ -0,0 +1,196 @@
+import datetime
+import warnings
+
+import numpy as np
+import pandas as pd
+import shapely
+
+import geo_utils
+import geometry
+import solar_position
+import sun_data
+import timezones
+
+DEFAULT_RESOLUTION_DEG = 0.1
+DEFAULT_CHUNK_SIZE = 250_000  # Max. number of grid cells held in memory at once
+SYNTHETIC_CITY_SIGMA_DEG = 0.15  # Spread of the population around each city (~15 km)
+SYNTHETIC_RURAL_DENSITY = 1.0  # Weight of every cell without any city nearby
+PERCENTILES = (10, 50, 90)
+
+# Fixed histogram bins used to compute weighted percentiles without keeping all cells in memory,
+# values outside are counted in the first/last bin
+LONGDIFF_BINS_KM = np.arange(-4000, 4001, 1.0)
+SUNRISE_BINS_MIN = np.arange(-720, 2161, 1.0)
+
+
+def get_gridded_country_data(countries=None, resolution_deg: float = DEFAULT_RESOLUTION_DEG, population=None,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Rasterizes every country into a regular lat/lon grid and computes the distance to the timezone meridian
+    and the average sunrise in the summer and winter period (local standard time, see sun_data) for each cell.
+    Cells are processed in chunks and reduced to population weighted means and percentiles per country
+    on the fly, so memory stays bounded for any resolution. Only the parts of a country within
+    timezones.TIMEZONE_BOUNDS are rasterized, overseas territories (e.g. French Guiana) are left out.
+    :param countries: GeoDataFrame with iso_a2 and geometry columns, defaults to geo_utils.load_eu_countries_as_geopandas().
+    :param resolution_deg: Edge length of a grid cell in degrees.
+    :param population: Callable mapping (lon, lat) arrays of cell centers to population weights,
+    defaults to synthetic_population_from_cities() using datasets/saved/city_data.csv.
+    :param chunk_size: Max. number of grid cells processed at once.
+    :return: Returns a dataframe with one row per country containing weighted means and percentiles of
+    longitudinal_diff_km, summer_sunrise_min and winter_sunrise_min (minutes since local midnight),
+    the differences to 9:00 in hours and the number of cells and total population weight.
+    """
+    countries = geo_utils.load_eu_countries_as_geopandas() if countries is None else countries
+    countries = countries.to_crs(4326)
+    population = synthetic_population_from_cities() if population is None else population
+    summer_mask = _summer_period_mask(pd.date_range(start=f'{sun_data.YEAR}-01-01', end=f'{sun_data.YEAR}-12-31'))
+
+    resolver = timezones.get_resolver()
+    rows = []
+    for iso_a2, country_geometry in zip(countries['iso_a2'], countries.geometry):
+        # Overseas territories are outside the resolver's timezones and would get the European country offset
+        country_geometry = shapely.clip_by_rect(country_geometry, *timezones.TIMEZONE_BOUNDS)
+        country_offset = geo_utils.get_timezone_df().loc[iso_a2, 'gmt_offset']
+        lon_axis, lat_axis = _grid_axes(country_geometry.bounds, resolution_deg)
+        summer_by_lat, winter_by_lat = _sunrise_by_latitude(lat_axis, summer_mask)
+        stats = _CountryAccumulator()
+        for lon, lat, lat_idx in _iter_country_cells(country_geometry, lon_axis, lat_axis, chunk_size):
+            weights = population(lon, lat)
+            # Timezone of each cell, cells outside all timezone polygons (coast) use the country timezone
+            utc_offset = resolver.standard_offsets(lon, lat, sun_data.YEAR)
+            utc_offset = np.where(np.isnan(utc_offset), country_offset, utc_offset)
+            longdiff = geometry.meridian_distance_km(lon, lat, utc_offset)
+            # Sunrise in UTC only depends on latitude, longitude shifts it by 4 minutes per degree
+            local_shift = 60 * utc_offset - 4.0 * lon
+            summer = summer_by_lat[lat_idx] + local_shift
+            winter = winter_by_lat[lat_idx] + local_shift
+            stats.add(weights, longdiff, summer, winter)
+        rows.append({'country_ISO_A2': iso_a2, **stats.result()})
+    return pd.DataFrame(rows)
+
+
+def synthetic_population_from_cities(city_data: pd.DataFrame = None, sigma_deg: float = SYNTHETIC_CITY_SIGMA_DEG,
+                                     rural_density: float = SYNTHETIC_RURAL_DENSITY):
+    """
+    Builds a synthetic population density as a sum of gaussian kernels around known cities
+    on top of a constant rural density.
+    :param city_data: Dataframe with longitude, latitude and population columns, defaults to datasets/saved/city_data.csv.
+    :param sigma_deg: Standard deviation of each city kernel in degrees.
+    :param rural_density: Constant weight added to every cell.
+    :return: Returns a callable mapping (lon, lat) arrays to population weights.
+    """
+    city_data = pd.read_csv('datasets/saved/city_data.csv') if city_data is None else city_data
+    city_lon = city_data['longitude'].to_numpy(dtype='float64')
+    city_lat = city_data['latitude'].to_numpy(dtype='float64')
+    city_pop = city_data['population'].to_numpy(dtype='float64')
+    peak_density = city_pop / (2 * np.pi * sigma_deg ** 2)
+
+    def population(lon, lat):
+        density = np.full(lon.shape, rural_density, dtype='float64')
+        for c_lon, c_lat, c_peak in zip(city_lon, city_lat, peak_density):  # Loop over cities, not cells
+            near = (np.abs(lon - c_lon) < 5 * sigma_deg) & (np.abs(lat - c_lat) < 5 * sigma_deg)
+            d2 = (lon[near] - c_lon) ** 2 + (lat[near] - c_lat) ** 2
+            density[near] += c_peak * np.exp(-d2 / (2 * sigma_deg ** 2))
+        return density
+
+    return population
+
+
+def raster_population(path: str):
+    """
+    Loads a population raster from an .npz file with the regular, ascending 1D cell center axes 'lon' and 'lat'
+    and the 2D array 'population' of shape (len(lat), len(lon)). Cells are sampled by nearest neighbour,
+    cells outside the raster get a weight of 0.
+    :param path: Path to the .npz file.
+    :return: Returns a callable mapping (lon, lat) arrays to population weights.
+    """
+    with np.load(path, allow_pickle=False) as raster:
+        axis_lon, axis_lat, values = raster['lon'], raster['lat'], raster['population']
+
+    def population(lon, lat):
+        col = np.rint((lon - axis_lon[0]) / (axis_lon[1] - axis_lon[0])).astype('int64')
+        row = np.rint((lat - axis_lat[0]) / (axis_lat[1] - axis_lat[0])).astype('int64')
+        inside = (col >= 0) & (col < len(axis_lon)) & (row >= 0) & (row < len(axis_lat))
+        weights = np.zeros(lon.shape, dtype='float64')
+        weights[inside] = values[row[inside], col[inside]]
+        return weights
+
+    return population
+
+
+class _CountryAccumulator:
+    """
+    Running population weighted sums and histograms of the per cell values of one country.
+    """
+
+    def __init__(self):
+        self.cells = 0
+        self.weight = 0.0
+        self.sums = {'longitudinal_diff_km': 0.0, 'summer_sunrise_min': 0.0, 'winter_sunrise_min': 0.0}
+        self.hists = {'longitudinal_diff_km': np.zeros(len(LONGDIFF_BINS_KM) - 1),
+                      'summer_sunrise_min': np.zeros(len(SUNRISE_BINS_MIN) - 1),
+                      'winter_sunrise_min': np.zeros(len(SUNRISE_BINS_MIN) - 1)}
+        self.bins = {'longitudinal_diff_km': LONGDIFF_BINS_KM, 'summer_sunrise_min': SUNRISE_BINS_MIN,
+                     'winter_sunrise_min': SUNRISE_BINS_MIN}
+
+    def add(self, weights, longdiff, summer, winter):
+        valid = ~(np.isnan(summer) | np.isnan(winter))  # Cells without any sunrise in a period (polar night/day)
+        weights = weights[valid]
+        self.cells += int(valid.sum())
+        self.weight += weights.sum()
+        for col, values in [('longitudinal_diff_km', longdiff), ('summer_sunrise_min', summer),
+                            ('winter_sunrise_min', winter)]:
+            values = values[valid]
+            self.sums[col] += (weights * values).sum()
+            bins = self.bins[col]
+            self.hists[col] += np.histogram(np.clip(values, bins[0], bins[-1]), bins=bins, weights=weights)[0]
+
+    def result(self) -> dict:
+        result = {'cells': self.cells, 'population': self.weight}
+        for col in self.sums:
+            result[f'mean_{col}'] = self.sums[col] / self.weight if self.weight > 0 else np.nan
+            cumulative = np.cumsum(self.hists[col])
+            for q in PERCENTILES:
+                idx = np.searchsorted(cumulative, cumulative[-1] * q / 100) if self.weight > 0 else None
+                result[f'p{q}_{col}'] = self.bins[col][idx] if idx is not None else np.nan
+        for period in ('summer', 'winter'):
+            result[f'{period}_diff_h'] = (9 * 60 - result[f'mean_{period}_sunrise_min']) / 60
+        return result
+
+
+def _grid_axes(bounds, resolution_deg: float) -> tuple[np.ndarray, np.ndarray]:
+    # Grid aligned to multiples of the resolution, so cells are identical for all countries
+    min_x, min_y, max_x, max_y = bounds
+    lon_axis = np.arange(np.floor(min_x / resolution_deg), np.ceil(max_x / resolution_deg) + 1) * resolution_deg
+    lat_axis = np.arange(np.floor(min_y / resolution_deg), np.ceil(max_y / resolution_deg) + 1) * resolution_deg
+    return lon_axis, lat_axis
+
+
+def _iter_country_cells(geometry, lon_axis: np.ndarray, lat_axis: np.ndarray, chunk_size: int):
+    shapely.prepare(geometry)
+    rows_per_chunk = max(1, chunk_size // len(lon_axis))
+    for start in range(0, len(lat_axis), rows_per_chunk):
+        lat_idx = np.repeat(np.arange(start, min(start + rows_per_chunk, len(lat_axis))), len(lon_axis))
+        lon = np.tile(lon_axis, len(lat_idx) // len(lon_axis))
+        lat = lat_axis[lat_idx]
+        inside = shapely.contains_xy(geometry, lon, lat)
+        if inside.any():
+            yield lon[inside], lat[inside], lat_idx[inside]
+
+
+def _sunrise_by_latitude(lat_axis: np.ndarray, summer_mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Mean sunrise in minutes since UTC midnight at longitude 0 for each latitude, in the summer and winter period
+    dates = pd.date_range(start=f'{sun_data.YEAR}-01-01', end=f'{sun_data.YEAR}-12-31')
+    sunrise = solar_position.solar_events(lat_axis, np.zeros(len(lat_axis)), dates)['sunrise']
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Latitudes without any sunrise in a period
+        return np.nanmean(sunrise[:, summer_mask], axis=1), np.nanmean(sunrise[:, ~summer_mask], axis=1)
+
+
+def _summer_period_mask(dates: pd.DatetimeIndex) -> np.ndarray:
+    # Same period definition as sun_data._calculate_sunrise_averages_for_countries
+    start = datetime.date(year=sun_data.YEAR, month=3, day=sun_data.LAST_SUNDAY_OF_MARCH)
+    end = datetime.date(year=sun_data.YEAR, month=10, day=sun_data.LAST_SUNDAY_OF_OCTOBER)
+    days = dates.date
+    return (days > start) & (days < end)
+
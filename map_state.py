@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+# Key prefixes of the arrays, read back by index.py (which cannot import this module, see index.load_saved_state)
+GEOMETRY_PREFIX = 'geom_'
+TABLE_PREFIX = 'table_'
+
+# Level of detail tiers of the country outlines, simplification tolerance in meters (EPSG:3857)
+SIMPLIFY_TOLERANCES = {'full': 0, 'medium': 10000, 'coarse': 25000}
+
+
+def build_map_state(eu_geo_tz, tolerances: dict[str, float] = None) -> dict[str, np.ndarray]:
+    """
+    Compiles the eu_geo_tz GeoDataFrame into flat numpy arrays that can be stored without pickling
+    and loaded without geopandas. Country outlines are stored once per country and level of detail tier
+    as float32 patch coordinates (exterior rings separated by NaN, like GeoJSONDataSource does for MultiPolygons).
+    :param eu_geo_tz: GeoDataFrame in EPSG:3857 with one row per country and DST setting.
+    :param tolerances: Dict mapping tier names to simplification tolerances, defaults to SIMPLIFY_TOLERANCES.
+    :return: Returns a dict of arrays, see index.state_table and index.state_patches for reading it back.
+    """
+    from geo_simplify import simplify_shared_borders
+
+    state = {}
+    table = pd.DataFrame(eu_geo_tz.drop(columns='geometry'))
+    for col in table.columns:
+        values = table[col]
+        state[TABLE_PREFIX + col] = values.to_numpy(dtype=str if values.dtype == object else values.dtype)
+
+    countries = eu_geo_tz.drop_duplicates('iso_a2')
+    state[GEOMETRY_PREFIX + 'iso_a2'] = countries['iso_a2'].to_numpy(dtype=str)
+    for tier, tolerance in (tolerances or SIMPLIFY_TOLERANCES).items():
+        xs, ys, offsets = [], [], [0]
+        for geometry in simplify_shared_borders(countries.geometry, tolerance):
+            x, y = _patch_coords(geometry)
+            xs.append(x)
+            ys.append(y)
+            offsets.append(offsets[-1] + len(x))
+        state[f'{GEOMETRY_PREFIX}{tier}_x'] = np.concatenate(xs).astype('float32')
+        state[f'{GEOMETRY_PREFIX}{tier}_y'] = np.concatenate(ys).astype('float32')
+        state[f'{GEOMETRY_PREFIX}{tier}_offsets'] = np.array(offsets, dtype='int64')
+    return state
+
+
+def _patch_coords(geometry) -> tuple[np.ndarray, np.ndarray]:
+    if geometry is None:  # Collapsed by simplification
+        return np.empty(0), np.empty(0)
+    polygons = geometry.geoms if geometry.geom_type == 'MultiPolygon' else [geometry]
+    xs, ys = [], []
+    for polygon in polygons:
+        coords = np.asarray(polygon.exterior.coords)
+        if xs:
+            xs.append([np.nan])
+            ys.append([np.nan])
+        xs.append(coords[:, 0])
+        ys.append(coords[:, 1])
+    return np.concatenate(xs), np.concatenate(ys)
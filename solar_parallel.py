@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import solar_position
+
+# Output arrays of solar_position.solar_events and their dtypes
+EVENT_DTYPES = {'sunrise': 'float64', 'sunset': 'float64', 'noon': 'float64', 'polar': 'int8'}
+MIN_SHARD_SIZE = 16  # Fewer cities per shard cost more in process overhead than they save
+
+
+def solar_events_parallel(latitudes, longitudes, dates, workers: int = None, shard_size: int = None) \
+        -> dict[str, np.ndarray]:
+    """
+    Same as solar_position.solar_events, but shards the locations across a process pool.
+    Coordinates and results are exchanged through shared memory, so no arrays are pickled, and every
+    shard writes into its own rows of the result, which makes the output independent of worker scheduling.
+    :param latitudes: Array-like of latitudes in degrees (n locations).
+    :param longitudes: Array-like of longitudes in degrees (n locations), east positive.
+    :param dates: Array-like of dates (m dates), anything accepted by pd.DatetimeIndex.
+    :param workers: Number of worker processes, defaults to os.cpu_count().
+    :param shard_size: Number of locations per task, defaults to an even split into 4 tasks per worker.
+    :return: Returns the same dict of (n, m) arrays as solar_position.solar_events.
+    """
+    workers = workers or os.cpu_count() or 1
+    coords = np.column_stack([np.asarray(latitudes, dtype='float64'), np.asarray(longitudes, dtype='float64')])
+    dates = pd.DatetimeIndex(dates)
+    n, m = len(coords), len(dates)
+    if workers == 1 or n <= MIN_SHARD_SIZE:
+        return solar_position.solar_events(coords[:, 0], coords[:, 1], dates)
+
+    shard_size = shard_size or max(MIN_SHARD_SIZE, -(-n // (4 * workers)))
+    blocks = {'coords': (coords.shape, 'float64'), **{key: ((n, m), dtype) for key, dtype in EVENT_DTYPES.items()}}
+    shms = {key: shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+            for key, (shape, dtype) in blocks.items()}
+    try:
+        np.ndarray(coords.shape, dtype='float64', buffer=shms['coords'].buf)[:] = coords
+        layout = {key: (shms[key].name, shape, dtype) for key, (shape, dtype) in blocks.items()}
+        date_values = dates.to_numpy(dtype='datetime64[ns]')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_solar_events_shard, layout, date_values, start, min(start + shard_size, n))
+                       for start in range(0, n, shard_size)]
+            for future in futures:
+                future.result()  # Re-raises errors of the workers
+        return {key: np.ndarray((n, m), dtype=dtype, buffer=shms[key].buf).copy()
+                for key, dtype in EVENT_DTYPES.items()}
+    finally:
+        for shm in shms.values():
+            shm.close()
+            shm.unlink()
+
+
+def _solar_events_shard(layout: dict, dates: np.ndarray, start: int, stop: int):
+    shms = {key: shared_memory.SharedMemory(name=name) for key, (name, _, _) in layout.items()}
+    try:
+        arrays = {key: np.ndarray(shape, dtype=dtype, buffer=shms[key].buf)
+                  for key, (_, shape, dtype) in layout.items()}
+        coords = arrays['coords'][start:stop]
+        events = solar_position.solar_events(coords[:, 0], coords[:, 1], dates)
+        for key in EVENT_DTYPES:
+            arrays[key][start:stop] = events[key]
+        del arrays, coords  # Views into the shared buffers must be released before closing them
+    finally:
+        for shm in shms.values():
+            shm.close()
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+import tracing
+
+# Using 32 arc minutes as sun's apparent diameter (same as astral)
+SUN_APPARENT_RADIUS = 32.0 / (60.0 * 2.0)
+SUNRISE_ZENITH = 90.0 + SUN_APPARENT_RADIUS
+
+# Status codes of the 'polar' array returned by solar_events
+NO_POLAR_EFFECT = 0
+POLAR_DAY = 1  # Sun never sets, sunrise/sunset are NaN
+POLAR_NIGHT = -1  # Sun never rises, sunrise/sunset are NaN
+
+MAX_LATITUDE = 89.8
+
+
+@tracing.traced
+def solar_events(latitudes, longitudes, dates) -> dict[str, np.ndarray]:
+    """
+    Calculates sunrise, sunset and solar noon for every combination of the given locations and dates
+    in a single vectorized pass. Uses the NOAA solar equations in the same way as the astral package does,
+    so results agree with astral.sun.sunrise/sunset/noon to well within a minute.
+    :param latitudes: Array-like of latitudes in degrees (n locations).
+    :param longitudes: Array-like of longitudes in degrees (n locations), east positive.
+    :param dates: Array-like of dates (m dates), anything accepted by pd.DatetimeIndex.
+    :return: Returns a dict with the keys 'sunrise', 'sunset', 'noon' holding float arrays of shape (n, m)
+    in minutes since UTC midnight of the respective date, and 'polar' holding an int8 array of shape (n, m)
+    with POLAR_DAY/POLAR_NIGHT where the sun does not cross the horizon (sunrise and sunset are NaN there).
+    """
+    lat = np.clip(np.asarray(latitudes, dtype='float64'), -MAX_LATITUDE, MAX_LATITUDE)[:, np.newaxis]
+    lon = np.asarray(longitudes, dtype='float64')[:, np.newaxis]
+    jd = julian_days(dates)[np.newaxis, :]
+    tracing.count('solar_position.location_days', lat.shape[0] * jd.shape[1])
+
+    zenith = SUNRISE_ZENITH + _refraction_at_zenith(SUNRISE_ZENITH)
+    sunrise, cos_h = _time_of_transit(lat, lon, jd, zenith, rising=True)
+    sunset, _ = _time_of_transit(lat, lon, jd, zenith, rising=False)
+
+    polar = np.full(cos_h.shape, NO_POLAR_EFFECT, dtype='int8')
+    polar[cos_h < -1] = POLAR_DAY
+    polar[cos_h > 1] = POLAR_NIGHT
+
+    noon = 720.0 - 4.0 * lon - _eq_of_time(_julian_century(jd))
+    return {'sunrise': sunrise, 'sunset': sunset, 'noon': np.broadcast_to(noon, sunrise.shape).copy(),
+            'polar': polar}
+
+
+def julian_days(dates) -> np.ndarray:
+    """
+    Converts dates to julian day numbers at the start of each (UTC) day.
+    :param dates: Array-like of dates, anything accepted by pd.DatetimeIndex.
+    :return: Returns a float64 array of julian day numbers.
+    """
+    days = pd.DatetimeIndex(dates).normalize()
+    return days.to_julian_date().to_numpy(dtype='float64')
+
+
+def _time_of_transit(lat: np.ndarray, lon: np.ndarray, jd: np.ndarray, zenith: float,
+                     rising: bool) -> tuple[np.ndarray, np.ndarray]:
+    # Two refinement steps just like astral.sun.time_of_transit
+    adjustment = 0.0
+    time_utc = None
+    cos_h = None
+    for _ in range(2):
+        jc = _julian_century(jd + adjustment)
+        declination = np.radians(_sun_declination(jc))
+        lat_rad = np.radians(lat)
+        cos_h = (np.cos(np.radians(zenith)) - np.sin(lat_rad) * np.sin(declination)) / (
+                np.cos(lat_rad) * np.cos(declination))
+        hour_angle = np.arccos(np.where(np.abs(cos_h) <= 1, cos_h, np.nan))
+        if not rising:
+            hour_angle = -hour_angle
+
+        offset = (-lon - np.degrees(hour_angle)) * 4.0 - _eq_of_time(jc)
+        offset = np.where(offset < -720.0, offset + 1440, offset)
+        time_utc = 720.0 + offset
+        adjustment = np.nan_to_num(time_utc / 1440.0)
+    return time_utc, cos_h
+
+
+def _julian_century(jd):
+    return (jd - 2451545.0) / 36525.0
+
+
+def _geom_mean_long_sun(jc):
+    return (280.46646 + jc * (36000.76983 + 0.0003032 * jc)) % 360.0
+
+
+def _geom_mean_anomaly_sun(jc):
+    return 357.52911 + jc * (35999.05029 - 0.0001537 * jc)
+
+
+def _eccentric_location_earth_orbit(jc):
+    return 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+
+
+def _sun_eq_of_center(jc):
+    m = np.radians(_geom_mean_anomaly_sun(jc))
+    return (np.sin(m) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+            + np.sin(2 * m) * (0.019993 - 0.000101 * jc)
+            + np.sin(3 * m) * 0.000289)
+
+
+def _sun_apparent_long(jc):
+    true_long = _geom_mean_long_sun(jc) + _sun_eq_of_center(jc)
+    omega = 125.04 - 1934.136 * jc
+    return true_long - 0.00569 - 0.00478 * np.sin(np.radians(omega))
+
+
+def _obliquity_correction(jc):
+    seconds = 21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))
+    e0 = 23.0 + (26.0 + (seconds / 60.0)) / 60.0
+    omega = 125.04 - 1934.136 * jc
+    return e0 + 0.00256 * np.cos(np.radians(omega))
+
+
+def _sun_declination(jc):
+    sint = np.sin(np.radians(_obliquity_correction(jc))) * np.sin(np.radians(_sun_apparent_long(jc)))
+    return np.degrees(np.arcsin(sint))
+
+
+def _eq_of_time(jc):
+    l0 = np.radians(_geom_mean_long_sun(jc))
+    e = _eccentric_location_earth_orbit(jc)
+    m = np.radians(_geom_mean_anomaly_sun(jc))
+    y = np.tan(np.radians(_obliquity_correction(jc)) / 2.0) ** 2
+
+    e_time = (y * np.sin(2.0 * l0)
+              - 2.0 * e * np.sin(m)
+              + 4.0 * e * y * np.sin(m) * np.cos(2.0 * l0)
+              - 0.5 * y * y * np.sin(4.0 * l0)
+              - 1.25 * e * e * np.sin(2.0 * m))
+    return np.degrees(e_time) * 4.0
+
+
+def _refraction_at_zenith(zenith: float) -> float:
+    # Scalar on purpose, the zenith is the same for all locations and dates
+    elevation = 90 - zenith
+    if elevation >= 85.0:
+        return 0
+    te = np.tan(np.radians(elevation))
+    if elevation > 5.0:
+        correction = 58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5
+    elif elevation > -0.575:
+        correction = 1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+    else:
+        correction = -20.774 / te
+    return correction / 3600.0
@@ -1,27 +1,70 @@
 import datetime
+import os
+import numpy as np
 import pandas as pd
-from astral import sun, LocationInfo
+
+import solar_position
+import tracing
+from dst_scenarios import last_sunday_of_month
 
 YEAR = 2022
-LAST_SUNDAY_OF_OCTOBER = 30  # At this date wintertime (ST) is activated again
-LAST_SUNDAY_OF_MARCH = 27  # At this date summertime (DST) is activated
+LAST_SUNDAY_OF_OCTOBER = last_sunday_of_month(YEAR, 10).day  # At this date wintertime (ST) is activated again
+LAST_SUNDAY_OF_MARCH = last_sunday_of_month(YEAR, 3).day  # At this date summertime (DST) is activated
+SUN_BACKEND = 'numpy'  # 'numpy' uses the vectorized solar_position engine, 'astral' the per-day astral calls
+SUN_WORKERS = None  # Worker processes of the 'parallel' backend, None uses all cores
 
 
-def get_sunrise_data_avgs_for_countries(top_cities: pd.DataFrame) -> pd.DataFrame:
+@tracing.traced
+def get_sunrise_data_avgs_for_countries(top_cities: pd.DataFrame, backend: str = SUN_BACKEND) -> pd.DataFrame:
+    """
+    Calculates the average sunrise times in the summer and winter period for each country, both
+    with and without DST, as well as their difference to 9:00.
+    :param top_cities: A dataframe where each row contains cities returned by geo_utils.get_eu_city_data
+    :param backend: Either 'numpy' (vectorized solar_position engine), 'parallel' (the same engine sharded
+    across SUN_WORKERS processes, see solar_parallel) or 'astral' (per-day astral calls).
+    :return: Returns a dataframe with the averaged sunrise data for each country. Times are given in minutes
+    since local midnight (summer_period_min, winter_period_min) and as "HH:MM" strings for display
+    (summer_period, winter_period).
+    """
     dates = pd.date_range(start=f'{YEAR}-01-01', end=f'{YEAR}-12-31').to_pydatetime()
-    sun_df = _calculate_sunrise_for_city_df(top_cities, dates)
+    if backend == 'numpy':
+        sun_df = _calculate_sunrise_for_city_df_numpy(top_cities, dates)
+    elif backend == 'parallel':
+        sun_df = _calculate_sunrise_for_city_df_numpy(top_cities, dates, workers=SUN_WORKERS or os.cpu_count())
+    elif backend == 'astral':
+        sun_df = _calculate_sunrise_for_city_df(top_cities, dates)
+    else:
+        raise ValueError(f"Unknown sun backend '{backend}', use 'numpy', 'parallel' or 'astral'.")
     avg_sun_df = _calculate_averages_for_countries_for_st_dst(sun_df)
     avg_sun_df = _add_differences_to_9_o_clock(avg_sun_df)
-    avg_sun_df = _reformat_timedelta_columns(avg_sun_df)
+    avg_sun_df = _add_formatted_time_columns(avg_sun_df)
     return avg_sun_df.reset_index()
 
 
+def format_minutes(minutes) -> np.ndarray:
+    """
+    :param minutes: Array of times in minutes since midnight, values past 24h wrap around to the next day.
+    Times are rounded to the nearest minute.
+    :return: Returns the times formatted as "HH:MM" strings, NaN values become empty strings.
+    """
+    minutes = np.asarray(minutes, dtype='float64')
+    valid = ~np.isnan(minutes)
+    total = np.zeros(minutes.shape, dtype='int64')
+    total[valid] = np.rint(minutes[valid]).astype('int64') % (24 * 60)
+    hours = np.char.zfill((total // 60).astype(str), 2)
+    mins = np.char.zfill((total % 60).astype(str), 2)
+    return np.where(valid, np.char.add(np.char.add(hours, ':'), mins), '')
+
+
+@tracing.traced
 def _calculate_sunrise_for_city_df(top_cities: pd.DataFrame, dates: list) -> pd.DataFrame:
     """
     :param top_cities: A dataframe where each row contains cities returned by geo_utils.get_eu_city_data
     :param dates: An iterable of pydatetimes to calculate sunrises for each city for.
     :return: Returns a pd.Dataframe containing the sunrise data for each given city in top_cities (e.g. each row).
     """
+    from astral import sun, LocationInfo
+
     sun_data = []
     for idx, row in top_cities.iterrows():
         location = LocationInfo(row['NAME'],
@@ -32,43 +75,67 @@ def _calculate_sunrise_for_city_df(top_cities: pd.DataFrame, dates: list) -> pd.
         for d in dates:
             try:
                 sunrise_utc = sun.sunrise(observer=location.observer, date=d)
-                sunrise_converted = _get_all_conversions_for_sunrise_time(sunrise_utc, row['utc_sun_timezone_offset'])
-                sun_data.append([row['country_ISO_A2'], row['NAME'], d.day, d.month, d.year,
-                                 sunrise_utc.hour, sunrise_utc.minute,  # Sunrise in UTC/GMT
-                                 ] + sunrise_converted)
+                sunrise_utc_min = (sunrise_utc.hour * 60 + sunrise_utc.minute + sunrise_utc.second / 60
+                                   + sunrise_utc.microsecond / 60e6)
+                sun_data.append([row['country_ISO_A2'], row['NAME'], d, sunrise_utc_min,
+                                 row['utc_sun_timezone_offset']])
             except ValueError:
                 print(f"Could not process day {d}")
+    tracing.count('sun_data.astral_sunrise_calls', len(top_cities) * len(dates))
 
-    columns = ['country_ISO_A2', 'NAME', 'day', 'month', 'year',
-               'sunrise_utc_hour', 'sunrise_minute',
-               'sunrise_local_hour', 'sunrise_local_hour_dst']
+    columns = ['country_ISO_A2', 'NAME', 'date', 'sunrise_utc_min', 'utc_offset']
     sun_df = pd.DataFrame(sun_data, columns=columns)
-    sun_df = _add_time_columns_to(sun_df)
+    sun_df = _add_local_time_columns_to(sun_df, sun_df.pop('utc_offset').to_numpy())
     return sun_df
 
 
-def _get_all_conversions_for_sunrise_time(sunrise_utc: datetime.datetime, city_utc_offset: int) -> list:
-    # Sunrise converted to STANDARD TIME OF CITY
-    sunrise_local_hour_st = sunrise_utc.hour + city_utc_offset
-    # Sunrise converted to DAYLIGHT SAVINGS TIME OF CITY
-    sunrise_local_hour_dst = sunrise_local_hour_st + 1
-    return [sunrise_local_hour_st, sunrise_local_hour_dst]
+@tracing.traced
+def _calculate_sunrise_for_city_df_numpy(top_cities: pd.DataFrame, dates: list, workers: int = 1) -> pd.DataFrame:
+    """
+    Same as _calculate_sunrise_for_city_df, but calculates all sunrises of all cities at once
+    using the vectorized solar_position engine. Days without a sunrise (polar day/night) are left out.
+    :param top_cities: A dataframe where each row contains cities returned by geo_utils.get_eu_city_data
+    :param dates: An iterable of pydatetimes to calculate sunrises for each city for.
+    :param workers: Number of processes the cities are sharded across (see solar_parallel), 1 runs in process.
+    :return: Returns a pd.Dataframe containing the sunrise data for each given city in top_cities (e.g. each row).
+    """
+    dates = pd.DatetimeIndex(dates)
+    if workers > 1:
+        import solar_parallel  # Process pools are only needed here (and not available in Pyodide)
+        events = solar_parallel.solar_events_parallel(top_cities['latitude'], top_cities['longitude'], dates, workers)
+    else:
+        events = solar_position.solar_events(top_cities['latitude'], top_cities['longitude'], dates)
+    has_sunrise = events['polar'].ravel() == solar_position.NO_POLAR_EFFECT
+
+    n_cities, n_dates = events['sunrise'].shape
+    city_idx = np.repeat(np.arange(n_cities), n_dates)[has_sunrise]
+    date_idx = np.tile(np.arange(n_dates), n_cities)[has_sunrise]
+
+    sun_df = pd.DataFrame({
+        'country_ISO_A2': top_cities['country_ISO_A2'].to_numpy()[city_idx],
+        'NAME': top_cities['NAME'].to_numpy()[city_idx],
+        'date': dates.to_numpy()[date_idx],
+        'sunrise_utc_min': events['sunrise'].ravel()[has_sunrise],
+    })
+    sun_df = _add_local_time_columns_to(sun_df, top_cities['utc_sun_timezone_offset'].to_numpy()[city_idx])
+    return sun_df
 
 
-def _add_time_columns_to(sun_df: pd.DataFrame) -> pd.DataFrame:
-    sun_df['date'] = pd.to_datetime(sun_df[['day', 'month', 'year']]).dt.date
-    sun_df['sunrise_local_time'] = sun_df.apply(
-        lambda x: datetime.time(hour=x['sunrise_local_hour'], minute=x['sunrise_minute']), axis=1)
-    sun_df['sunrise_local_dst_time'] = sun_df.apply(
-        lambda x: datetime.time(hour=x['sunrise_local_hour_dst'], minute=x['sunrise_minute']), axis=1)
+def _add_local_time_columns_to(sun_df: pd.DataFrame, utc_offset: np.ndarray) -> pd.DataFrame:
+    # Sunrise in minutes since midnight in the STANDARD TIME and DAYLIGHT SAVINGS TIME of each city,
+    # values past 24h are kept as they are, so averaging never wraps around
+    sun_df['date'] = pd.to_datetime(sun_df['date'])
+    sun_df['sunrise_local_min'] = sun_df['sunrise_utc_min'] + 60 * utc_offset
+    sun_df['sunrise_local_dst_min'] = sun_df['sunrise_local_min'] + 60
     return sun_df
 
 
+@tracing.traced
 def _calculate_averages_for_countries_for_st_dst(sun_df: pd.DataFrame) -> pd.DataFrame:
-    sun_df_dst = _calculate_sunrise_averages_for_countries(sun_df, 'sunrise_local_dst_time')
+    sun_df_dst = _calculate_sunrise_averages_for_countries(sun_df, 'sunrise_local_dst_min')
     sun_df_dst['dst'] = True
 
-    sun_df_st = _calculate_sunrise_averages_for_countries(sun_df, 'sunrise_local_time')
+    sun_df_st = _calculate_sunrise_averages_for_countries(sun_df, 'sunrise_local_min')
     sun_df_st['dst'] = False
 
     return pd.concat([sun_df_dst, sun_df_st])
@@ -76,45 +143,26 @@ def _calculate_averages_for_countries_for_st_dst(sun_df: pd.DataFrame) -> pd.Dat
 
 def _calculate_sunrise_averages_for_countries(sun_df: pd.DataFrame, time_column: str) -> pd.DataFrame:
     # Averages using both ST (+0h) and DST (+1h) in period of March to October ('Summertime')
-    summer_period_start = datetime.date(year=YEAR, month=3, day=LAST_SUNDAY_OF_MARCH)
-    summer_period_end = datetime.date(year=YEAR, month=10, day=LAST_SUNDAY_OF_OCTOBER)
-    summer_period_mask = (sun_df['date'] > summer_period_start) & (sun_df['date'] < summer_period_end)
-
-    delta_colname = time_column + '_delta'
-    sun_df[delta_colname] = pd.to_timedelta(sun_df[time_column].astype('str'))
-
-    local_time_summer = sun_df.loc[summer_period_mask].groupby('country_ISO_A2')[[delta_colname]].mean()
-
-    local_time_winter = sun_df.loc[~summer_period_mask].groupby('country_ISO_A2')[[delta_colname]].mean()
-
-    avg_sunrise_df = pd.concat([local_time_summer, local_time_winter], axis=1)
-    avg_sunrise_df.columns = ['summer_period', 'winter_period']
+    summer_period_start = np.datetime64(datetime.date(year=YEAR, month=3, day=LAST_SUNDAY_OF_MARCH))
+    summer_period_end = np.datetime64(datetime.date(year=YEAR, month=10, day=LAST_SUNDAY_OF_OCTOBER))
+    dates = sun_df['date'].to_numpy()
+    summer_period_mask = (dates > summer_period_start) & (dates < summer_period_end)
+
+    avg_sunrise_df = sun_df[time_column].groupby([sun_df['country_ISO_A2'], summer_period_mask]).mean().unstack()
+    avg_sunrise_df = avg_sunrise_df.reindex(columns=[True, False])
+    avg_sunrise_df.columns = ['summer_period_min', 'winter_period_min']
     return avg_sunrise_df
 
 
 def _add_differences_to_9_o_clock(avg_sun_df: pd.DataFrame) -> pd.DataFrame:
-    timestamp_9 = pd.Timedelta(hours=9)
-    avg_sun_df['summer_diff_h'] = avg_sun_df['summer_period'].apply(
-        lambda x: (timestamp_9 - x).total_seconds() / 60 / 60)
-    avg_sun_df['winter_diff_h'] = avg_sun_df['winter_period'].apply(
-        lambda x: (timestamp_9 - x).total_seconds() / 60 / 60)
+    minutes_9 = 9 * 60
+    avg_sun_df['summer_diff_h'] = (minutes_9 - avg_sun_df['summer_period_min']) / 60
+    avg_sun_df['winter_diff_h'] = (minutes_9 - avg_sun_df['winter_period_min']) / 60
     return avg_sun_df
 
 
-def _reformat_timedelta_columns(avg_sun_df: pd.DataFrame) -> pd.DataFrame:
-    avg_sun_df['summer_period'] = avg_sun_df['summer_period'].apply(lambda x: _get_time_from_timedelta(x))
-    avg_sun_df['winter_period'] = avg_sun_df['winter_period'].apply(lambda x: _get_time_from_timedelta(x))
+def _add_formatted_time_columns(avg_sun_df: pd.DataFrame) -> pd.DataFrame:
+    # The saved files keep the "HH:MM" columns of earlier versions, e.g. for circadian_rythm_interactive.ipynb
+    avg_sun_df['summer_period'] = format_minutes(avg_sun_df['summer_period_min'])
+    avg_sun_df['winter_period'] = format_minutes(avg_sun_df['winter_period_min'])
     return avg_sun_df
-
-
-def _get_time_from_timedelta(timedelta) -> str:
-    seconds = timedelta.total_seconds()
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    return datetime.time(hour=hours, minute=minutes).strftime("%H:%M")
-
-
-if __name__ == "__main__":
-    test_cities = pd.read_csv('datasets/saved/city_data.csv')
-    sun_data = get_sunrise_data_avgs_for_countries(test_cities)
-    pass
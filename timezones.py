@@ -0,0 +1,201 @@
+import datetime
+import functools
+import zoneinfo
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+# Lon/lat box covering the EU including the Azores, Madeira and the Canary Islands
+TIMEZONE_BOUNDS = (-32.0, 27.0, 45.0, 72.0)
+INDEX_CELL_DEG = 0.1  # Edge length of the lookup grid cells
+ZONE_CACHE_SIZE = 2 ** 16  # Max. number of coordinates remembered by TimezoneResolver.zone_at
+
+# Standard time abbreviations used for the social timezone, by UTC offset in hours
+STANDARD_ZONE_ABBREVIATIONS = {0: 'WET', 1: 'CET', 2: 'EET'}
+
+NO_ZONE = -1  # Zone id of points outside all land timezones (sea, outside TIMEZONE_BOUNDS)
+_MIXED_CELL = -2  # Grid cells crossed by a timezone border, resolved exactly per point
+
+
+class TimezoneResolver:
+    """
+    Bulk point-in-polygon lookup of the IANA timezone of lon/lat coordinates, using the land timezone polygons
+    bundled with timezonefinder. Polygons are indexed once in a regular grid: points in cells that lie completely
+    inside a single zone (or outside all zones) are resolved by array indexing, only points in cells crossed by
+    a border are tested exactly against the candidate polygons of an STRtree.
+    """
+
+    def __init__(self, bounds: tuple = TIMEZONE_BOUNDS, cell_deg: float = INDEX_CELL_DEG,
+                 cache_size: int = ZONE_CACHE_SIZE):
+        import shapely
+        self._polygons, polygon_zones = _load_zone_polygons(bounds)
+        self.zone_names, self._polygon_zone_ids = np.unique(polygon_zones, return_inverse=True)
+        shapely.prepare(self._polygons)
+        self._tree = shapely.STRtree(self._polygons)
+        self._bounds = bounds
+        self._cell_deg = cell_deg
+        min_x, min_y, max_x, max_y = bounds
+        self._shape = (int(np.ceil((max_y - min_y) / cell_deg)), int(np.ceil((max_x - min_x) / cell_deg)))
+        self._grid = self._build_grid()
+        self.zone_at = functools.lru_cache(maxsize=cache_size)(self._zone_at)
+
+    def zone_ids(self, lon, lat) -> np.ndarray:
+        """
+        :param lon: Array-like of longitudes in degrees.
+        :param lat: Array-like of latitudes in degrees, same shape as lon.
+        :return: Returns an int32 array of indices into zone_names, NO_ZONE where a point is not on land
+        within the resolver bounds.
+        """
+        lon = np.asarray(lon, dtype='float64')
+        lat = np.asarray(lat, dtype='float64')
+        row, col, inside = self._cells(lon, lat)
+        ids = np.full(lon.shape, NO_ZONE, dtype='int32')
+        ids[inside] = self._grid[row[inside], col[inside]]
+        mixed = ids == _MIXED_CELL
+        tracing.count('timezones.points', lon.size)
+        tracing.count('timezones.exact_points', int(mixed.sum()))
+        ids[mixed] = self._exact_zone_ids(lon[mixed], lat[mixed])
+        return ids
+
+    def zones(self, lon, lat) -> np.ndarray:
+        """
+        :param lon: Array-like of longitudes in degrees.
+        :param lat: Array-like of latitudes in degrees, same shape as lon.
+        :return: Returns the IANA timezone names of all points, empty strings where no zone was found.
+        """
+        ids = self.zone_ids(lon, lat)
+        return np.where(ids == NO_ZONE, '', self.zone_names[np.maximum(ids, 0)])
+
+    def utc_offsets(self, lon, lat, date: datetime.date) -> np.ndarray:
+        """
+        :param lon: Array-like of longitudes in degrees.
+        :param lat: Array-like of latitudes in degrees, same shape as lon.
+        :param date: Date at which the offsets are valid (DST is taken into account at noon UTC).
+        :return: Returns the UTC offsets in hours of all points, NaN where no zone was found.
+        """
+        offsets = [_utc_offset(name, date) for name in self.zone_names]
+        return self._by_zone(self.zone_ids(lon, lat), offsets)
+
+    def standard_offsets(self, lon, lat, year: int) -> np.ndarray:
+        """
+        :param lon: Array-like of longitudes in degrees.
+        :param lat: Array-like of latitudes in degrees, same shape as lon.
+        :param year: Year of the timezone rules, e.g. sun_data.YEAR (zones changed their standard time in the past).
+        :return: Returns the standard time (without DST) UTC offsets in hours of all points, NaN where no
+        zone was found.
+        """
+        offsets = [_standard_offset(name, year) for name in self.zone_names]
+        return self._by_zone(self.zone_ids(lon, lat), offsets)
+
+    def _by_zone(self, ids: np.ndarray, zone_values: list[float]) -> np.ndarray:
+        # Values are only calculated once per distinct zone and then indexed by zone id, NaN for NO_ZONE
+        zone_values = np.array(zone_values + [np.nan], dtype='float64')
+        return zone_values[np.where(ids == NO_ZONE, len(self.zone_names), ids)]
+
+    def _zone_at(self, lon: float, lat: float) -> str:
+        return str(self.zones(np.array([lon]), np.array([lat]))[0])
+
+    def _cells(self, lon: np.ndarray, lat: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Grid row and column of each point and whether it lies within the grid (NaN coordinates do not)
+        min_x, min_y, _, _ = self._bounds
+        with np.errstate(invalid='ignore'):
+            col = np.floor((lon - min_x) / self._cell_deg)
+            row = np.floor((lat - min_y) / self._cell_deg)
+            inside = (col >= 0) & (col < self._shape[1]) & (row >= 0) & (row < self._shape[0])
+        return np.where(inside, row, 0).astype('int64'), np.where(inside, col, 0).astype('int64'), inside
+
+    def _exact_zone_ids(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        import shapely
+        ids = np.full(lon.shape, NO_ZONE, dtype='int32')
+        if not len(lon):
+            return ids
+        # Candidates by bounding box, then one prepared point-in-polygon test per polygon for all its candidates
+        point_idx, polygon_idx = self._tree.query(shapely.points(lon, lat))
+        order = np.argsort(polygon_idx, kind='stable')
+        point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(polygon_idx) != 0])
+        for points, polygon in zip(np.split(point_idx, starts[1:]), polygon_idx[starts]):
+            inside = shapely.contains_xy(self._polygons[polygon], lon[points], lat[points])
+            ids[points[inside]] = self._polygon_zone_ids[polygon]
+        return ids
+
+    def _build_grid(self) -> np.ndarray:
+        import shapely
+        min_x, min_y, _, _ = self._bounds
+        n_rows, n_cols = self._shape
+
+        # Every point of a border segmentized to a quarter cell lies within an eighth cell of one of its vertices,
+        # so all cells crossed by a border are among the vertex cells and their direct neighbours
+        vertices = shapely.get_coordinates(shapely.segmentize(shapely.boundary(self._polygons), self._cell_deg / 4))
+        row, col, inside = self._cells(vertices[:, 0], vertices[:, 1])
+        mixed = np.zeros((n_rows, n_cols), dtype=bool)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                mixed[np.clip(row[inside] + d_row, 0, n_rows - 1), np.clip(col[inside] + d_col, 0, n_cols - 1)] = True
+
+        # All other cells are uniform, their zone is the zone of their center
+        grid = np.full((n_rows, n_cols), _MIXED_CELL, dtype='int32')
+        uniform_row, uniform_col = np.nonzero(~mixed)
+        grid[uniform_row, uniform_col] = self._exact_zone_ids(min_x + (uniform_col + 0.5) * self._cell_deg,
+                                                              min_y + (uniform_row + 0.5) * self._cell_deg)
+        return grid
+
+
+@functools.lru_cache(maxsize=None)
+@tracing.traced
+def get_resolver() -> TimezoneResolver:
+    """
+    :return: Returns the TimezoneResolver for TIMEZONE_BOUNDS, built on first use (takes a few seconds)
+    and shared afterwards.
+    """
+    return TimezoneResolver()
+
+
+def standard_abbreviations(standard_offsets) -> np.ndarray:
+    """
+    :param standard_offsets: Array-like of standard time UTC offsets in hours.
+    :return: Returns the abbreviation of each offset (see STANDARD_ZONE_ABBREVIATIONS), "UTC+h" for other offsets
+    and empty strings for NaN.
+    """
+    offsets = pd.Series(np.asarray(standard_offsets, dtype='float64'))
+    other = offsets.map(lambda h: f'UTC{h:+g}' if h == h else '')
+    return offsets.map(STANDARD_ZONE_ABBREVIATIONS).fillna(other).to_numpy(dtype=str)
+
+
+@functools.lru_cache(maxsize=None)
+def _utc_offset(zone_name: str, date: datetime.date) -> float:
+    # UTC offset in hours of a zone at noon UTC of date
+    moment = datetime.datetime(date.year, date.month, date.day, 12, tzinfo=datetime.timezone.utc)
+    return moment.astimezone(zoneinfo.ZoneInfo(zone_name)).utcoffset().total_seconds() / 3600
+
+
+def _standard_offset(zone_name: str, year: int) -> float:
+    # The lower of the winter and summer offset. dst() cannot be used, as Europe/Dublin is modelled with
+    # summer time as standard time and a negative DST in winter
+    return min(_utc_offset(zone_name, datetime.date(year, 1, 15)), _utc_offset(zone_name, datetime.date(year, 7, 15)))
+
+
+def _load_zone_polygons(bounds: tuple) -> tuple[np.ndarray, list[str]]:
+    # Land timezone polygons of timezonefinder intersecting bounds, ocean zones (Etc/GMT...) are left out
+    import shapely
+    from timezonefinder import TimezoneFinder
+
+    tf = TimezoneFinder()
+    min_x, min_y, max_x, max_y = bounds
+    zone_ids = tf.zone_ids_of(np.arange(tf.nr_of_polygons))
+    polygons, zones = [], []
+    for polygon_nr, zone_id in enumerate(zone_ids):
+        name = tf.timezone_names[zone_id]
+        if name.startswith('Etc/'):
+            continue
+        lon, lat = tf.coords_of(polygon_nr) / 10 ** 7  # Stored as int32 with 7 decimal places
+        if lon.max() < min_x or lon.min() > max_x or lat.max() < min_y or lat.min() > max_y:
+            continue
+        # get_polygon converts all coordinates to lists, so it is only used for the few polygons with holes
+        holes = [np.column_stack(hole) for hole in tf.get_polygon(polygon_nr)[1:]] \
+            if polygon_nr in tf.hole_registry else None
+        polygons.append(shapely.Polygon(np.column_stack([lon, lat]), holes=holes))
+        zones.append(name)
+    return np.array(polygons, dtype=object), zones
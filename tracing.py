@@ -0,0 +1,159 @@
+"""
+Opt-in instrumentation of the data pipeline: timed spans around the pipeline stages and counters (rows processed,
+geocode cache hits and misses, sunrise calculations, ...), exported as a Chrome trace JSON file that can be
+opened in chrome://tracing, https://ui.perfetto.dev or https://www.speedscope.app.
+
+Tracing is off by default and then costs one global lookup per span or counter. It is enabled by setting the
+environment variable CIRCADIAN_TRACE to the output path (the trace is written when the interpreter exits), by
+`python build_data.py --trace [PATH]` or by calling enable() and export() directly.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+TRACE_ENV_VAR = 'CIRCADIAN_TRACE'
+DEFAULT_TRACE_PATH = 'datasets/cache/trace.json'
+
+_events = None  # List of Chrome trace events while tracing is enabled, None while it is disabled
+_counters = {}
+_lock = threading.Lock()
+_start_ns = time.perf_counter_ns()
+
+
+def enable():
+    """
+    Starts recording spans and counters, drops everything recorded before.
+    """
+    global _events
+    with _lock:
+        _events = []
+        _counters.clear()
+
+
+def disable():
+    """
+    Stops recording and drops everything recorded so far.
+    """
+    global _events
+    with _lock:
+        _events = None
+        _counters.clear()
+
+
+def is_enabled() -> bool:
+    return _events is not None
+
+
+@contextlib.contextmanager
+def _recorded_span(name: str, args: dict):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        _add_event({'name': name, 'ph': 'X', 'ts': _micros(start), 'dur': (time.perf_counter_ns() - start) / 1000,
+                    'args': args})
+
+
+def span(name: str, **args):
+    """
+    Context manager timing the enclosed block as one span of the trace.
+    :param name: Name of the span, e.g. 'geo_utils.geocoding'.
+    :param args: Additional values shown with the span, e.g. the number of rows processed.
+    :return: Returns the context manager, a shared no-op one while tracing is disabled.
+    """
+    if _events is None:
+        return _NO_SPAN
+    return _recorded_span(name, args)
+
+
+def traced(func):
+    """
+    Decorator recording every call of func as a span named '<module>.<function>'.
+    """
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _events is None:
+            return func(*args, **kwargs)
+        with _recorded_span(name, {}):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def count(name: str, value: int = 1):
+    """
+    Adds value to the counter name, the running total is shown as a counter track in the trace.
+    :param name: Name of the counter, e.g. 'geocoding.cache_hits'.
+    :param value: Amount to add.
+    """
+    if _events is None:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        total = _counters[name]
+    _add_event({'name': name, 'ph': 'C', 'ts': _micros(time.perf_counter_ns()), 'args': {'value': total}})
+
+
+def counters() -> dict[str, int]:
+    """
+    :return: Returns the totals of all counters recorded since tracing was enabled.
+    """
+    with _lock:
+        return dict(_counters)
+
+
+def summary() -> list[tuple[str, int, float]]:
+    """
+    :return: Returns (span name, number of calls, total seconds) of all recorded spans, longest total first.
+    """
+    totals = {}
+    with _lock:
+        spans = [e for e in _events or [] if e['ph'] == 'X']
+    for event in spans:
+        calls, seconds = totals.get(event['name'], (0, 0.0))
+        totals[event['name']] = (calls + 1, seconds + event['dur'] / 1e6)
+    return sorted(((name, calls, seconds) for name, (calls, seconds) in totals.items()), key=lambda t: -t[2])
+
+
+def export(path: str = DEFAULT_TRACE_PATH) -> str:
+    """
+    Writes everything recorded so far as a Chrome trace JSON file.
+    :param path: Output path.
+    :return: Returns the path written to.
+    """
+    with _lock:
+        events = list(_events or [])
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'counters': counters()}}, f)
+    return path
+
+
+def _add_event(event: dict):
+    event.update(pid=os.getpid(), tid=threading.get_ident())
+    with _lock:
+        if _events is not None:
+            _events.append(event)
+
+
+def _micros(ns: int) -> float:
+    return (ns - _start_ns) / 1000
+
+
+def _export_at_exit(path: str):
+    # Worker processes (e.g. of solar_parallel) inherit the environment variable, only the main process writes
+    if multiprocessing.parent_process() is None:
+        export(path)
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+if os.environ.get(TRACE_ENV_VAR):
+    enable()
+    atexit.register(_export_at_exit, os.environ[TRACE_ENV_VAR])